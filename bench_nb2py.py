@@ -0,0 +1,164 @@
+import sys
+import os
+import time
+import json
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+import nb2py
+
+header = '''# ---
+# jupyter:
+#   jupytext:
+#     text_representation:
+#       extension: .py
+#       format_name: percent
+#       format_version: '1.3'
+#       jupytext_version: 1.13.6
+#   kernelspec:
+#     display_name: Python 3 (ipykernel)
+#     language: python
+#     name: python3
+# ---
+'''
+
+code_cells = [
+    'x = np.array([1,2,1])\n\nprint(x)',
+    'def addone(x):\n    return x+1\n',
+    'for i in range(10):\n    if i%2==0:\n        print(i)',
+    "fig = plt.figure(figsize=(10,4))\nplt.plot(x,np.sin(x),label='sine')\nplt.legend()",
+    '# a comment\ny = [i**2 for i in range(20)]',
+]
+
+def markdown_cell(rng, nlines):
+    lines = ['# ## Section {}'.format(rng.randint(0,1000)), '#']
+    for i in range(nlines):
+        lines.append(rng.choice([
+            '# + NumPy is a package for performing computations with **numerical lists**. ',
+            '# Create an ndarray with `np.array()`:',
+            '# | NumPy arrays | Lists |',
+            '#',
+            '# [Tutorial](https://numpy.org/devdocs/user/quickstart.html)',
+        ]))
+    return '\n'.join(lines)
+
+def synthetic_script(ncells, markdown_lines, seed=0):
+    # Alternates markdown and code cells like the lab1 tutorials
+    rng = random.Random(seed)
+    parts = [header]
+    for i in range(ncells):
+        if i%2==0:
+            parts.append('# %% [markdown]\n'+markdown_cell(rng, markdown_lines)+'\n')
+        else:
+            parts.append('# %%\n'+rng.choice(code_cells)+'\n')
+    return '\n'.join(parts)
+
+def py_to_ipynb(engine):
+    def run(source, dest):
+        nb2py.convert(source, dest, engine)
+    return run
+
+def ipynb_to_py(source, dest):
+    import jupytext
+    jupytext.write(jupytext.read(source), dest, fmt='py:percent')
+
+def cold_start(engine, source, dest):
+    # One conversion in a fresh interpreter, import time included
+    code = 'import sys; sys.path.insert(0,{!r}); import nb2py; nb2py.convert({!r},{!r},{!r})'.format(
+        nb2py.this_folder, source, dest, engine)
+    tic = time.perf_counter()
+    subprocess.run([sys.executable,'-c',code], check=True)
+    return time.perf_counter()-tic
+
+def measure(convert, source, dest, ncells, repeat):
+    convert(source, dest)   # warm up imports and caches
+    times = []
+    for i in range(repeat):
+        tic = time.perf_counter()
+        convert(source, dest)
+        times.append(time.perf_counter()-tic)
+    tracemalloc.start()
+    convert(source, dest)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latency = statistics.median(times)
+    return {'latency_s':latency, 'min_s':min(times), 'cells_per_s':ncells/latency, 'peak_bytes':peak}
+
+def run_benchmarks(cell_counts, markdown_lines, repeat, folder):
+    results = []
+    for ncells in cell_counts:
+        for nlines in markdown_lines:
+            script = os.path.join(folder,'bench_{}_{}.py'.format(ncells,nlines))
+            notebook = os.path.join(folder,'bench_{}_{}.ipynb'.format(ncells,nlines))
+            roundtrip = os.path.join(folder,'bench_{}_{}_roundtrip.py'.format(ncells,nlines))
+            with open(script,'w') as file:
+                file.write(synthetic_script(ncells, nlines))
+            size = os.path.getsize(script)
+            if nb2py.convert(script, notebook)[2]!='fast':
+                print('warning: the fast path does not handle', script)
+
+            cases = [('py2ipynb','fast',py_to_ipynb('auto'),script,notebook),
+                     ('py2ipynb','jupytext',py_to_ipynb('jupytext'),script,notebook),
+                     ('ipynb2py','jupytext',ipynb_to_py,notebook,roundtrip)]
+            for direction, engine, convert, source, dest in cases:
+                result = {'name':'{}/{}/cells={}/md_lines={}'.format(direction,engine,ncells,nlines),
+                          'direction':direction, 'engine':engine, 'cells':ncells,
+                          'markdown_lines':nlines, 'bytes':size}
+                result.update(measure(convert, source, dest, ncells, repeat))
+                if direction=='py2ipynb':
+                    result['cold_start_s'] = cold_start('auto' if engine=='fast' else 'jupytext', source, dest)
+                results.append(result)
+                print('{:45s} {:9.4f}s {:12.0f} cells/s {:10.1f} MiB'.format(
+                    result['name'], result['latency_s'], result['cells_per_s'], result['peak_bytes']/2**20))
+    return results
+
+def compare(results, baseline, threshold):
+    # A case regresses when its median latency grew by more than `threshold` (relative)
+    previous = {result['name']:result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        if result['name'] not in previous:
+            continue
+        ratio = result['latency_s']/previous[result['name']]['latency_s']
+        if ratio>1+threshold:
+            regressions.append((result['name'],ratio))
+            print('REGRESSION {:45s} {:.2f}x slower'.format(result['name'],ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark notebook conversion throughput.')
+    parser.add_argument('--cells', type=int, nargs='+', default=[100,1000,5000],
+                        help='number of cells in the synthetic scripts')
+    parser.add_argument('--markdown-lines', type=int, nargs='+', default=[5,200],
+                        help='lines per markdown cell')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', default='bench_output.json',
+                        help='where to write the results (JSON)')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='results file of an earlier run to check against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = run_benchmarks(args.cells, args.markdown_lines, args.repeat, folder)
+
+    report = {'python':platform.python_version(), 'platform':platform.platform(),
+              'jupytext':nb2py.jupytext_version(), 'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'results':results}
+    with open(args.output,'w') as file:
+        json.dump(report, file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__=='__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+import sys
+import os
+import time
+import pickle
+import argparse
+import numpy as np
+
+import lsq
+import gd
+import sgd
+import optimizers
+
+this_folder = os.path.dirname(os.path.realpath(__file__))
+
+def load_data():
+    with open(os.path.join(this_folder,'1d_data.pickle'), 'rb') as file:
+        return pickle.load(file)
+
+def synthetic_samples(N, seed=0):
+    return lsq.sampleXY(N, 0.2, -0.4, 0.0049, rng=seed)
+
+def ill_conditioned_samples(N, shift=20, seed=0):
+    # x ~ U(shift, shift+1): the columns of Phi = [1, x] are nearly parallel and
+    # cond(Phi^T Phi) grows like shift^4
+    XY = lsq.sampleXY(N, 0.2, -0.4, 0.0049, rng=seed)
+    XY[:,1] -= 0.4*shift
+    XY[:,0] += shift
+    return XY
+
+def timeit(f, *args, repeat=3):
+    best = np.inf
+    for i in range(repeat):
+        tic = time.perf_counter()
+        out = f(*args)
+        best = min(best, time.perf_counter()-tic)
+    return best, out
+
+def bench_grid(XYsamp, K=200, gamma=0.01):
+    # Per-point loop against the batched engine, for growing grids
+    print('{:>8s} {:>12s} {:>12s} {:>8s}'.format('points','loop [s]','batch [s]','speedup'))
+    for gridN in [5,20,50,100,316]:
+        theta0_grid, theta1_grid = gd.make_grid(gridN)
+        t_batch, batch = timeit(gd.run_gd_on_grid, XYsamp, theta0_grid, theta1_grid, K, gamma)
+        if gridN<=50:
+            t_loop, loop = timeit(gd.run_gd_on_grid_loop, XYsamp, theta0_grid, theta1_grid, K, gamma, repeat=1)
+            assert np.allclose(loop, batch)
+        else:
+            t_loop = np.nan
+        print('{:8d} {:12.4f} {:12.4f} {:8.1f}'.format(gridN**2, t_loop, t_batch, t_loop/t_batch))
+
+def bench_gradient(XYsamp, evaluations=200):
+    # Cost of one gradient evaluation from the samples and from the sufficient statistics
+    print('{:>9s} {:>14s} {:>14s} {:>12s}'.format('N','nablaJ [us]','problem [us]','setup [ms]'))
+    theta = np.array([0.5,-1.0])
+    for N in [40,10**3,10**5,10**6]:
+        XY = XYsamp if N==40 else synthetic_samples(N)
+        t_setup, problem = timeit(lsq.LeastSquares.from_samples, XY)
+        t_samples, g1 = timeit(lambda: [lsq.nablaJ(XY,*theta) for i in range(evaluations)])
+        t_stats, g2 = timeit(lambda: [problem.grad(theta) for i in range(evaluations)])
+        assert np.allclose(g1[0], g2[0])
+        print('{:9d} {:14.2f} {:14.2f} {:12.3f}'.format(N, 1e6*t_samples/evaluations, 1e6*t_stats/evaluations, 1e3*t_setup))
+
+def bench_solve(XYsamp):
+    # Speed and accuracy of the solve_design methods on polynomial features of x.
+    # The error is the normal-equation residual |Phi^T (Phi theta - Y)| / (|Phi|^2 |theta| + |Phi| |Y|).
+    methods = ['inv','cholesky','qr','lstsq','auto']
+    print('{:>8s} {:>3s} {:>9s}  '.format('N','d','cond')+' '.join('{:>19s}'.format(m) for m in methods))
+    for N in [10**3,10**5,10**6]:
+        XY = synthetic_samples(N)
+        for d in [2,5,10]:
+            Phi = np.vander(XY[:,0], d, increasing=True)
+            Y = XY[:,1]
+            row = []
+            for method in methods:
+                t, theta = timeit(lsq.solve_design, Phi, Y, method)
+                nPhi = np.linalg.norm(Phi,2)
+                err = np.linalg.norm(Phi.T@(Phi@theta-Y))/(nPhi**2*np.linalg.norm(theta)+nPhi*np.linalg.norm(Y))
+                row.append('{:8.2e}s {:8.1e}'.format(t,err))
+            print('{:8d} {:3d} {:9.1e}  '.format(N,d,np.linalg.cond(Phi))+' '.join('{:>19s}'.format(r) for r in row))
+
+def bench_sgd(XYsamp, N=10**6, gamma=0.01):
+    # Samples processed per second for one epoch, by batch size
+    XY = synthetic_samples(N)
+    print('{:>10s} {:>10s} {:>14s}'.format('batch','time [s]','samples/s'))
+    for batch_size in [1,32,1024,N]:
+        t, traj = timeit(sgd.SGD, XY, gamma, 1, batch_size, 0)
+        print('{:>10d} {:10.4f} {:14.3e}'.format(batch_size, t, N/t))
+
+def bench_optimizers(XYsamp, K=20000, tol=1e-6, grid=10):
+    # Iterations until every run of a grid of start points is within tol of the
+    # minimizer, and wall time for K iterations. Step sizes come from the
+    # spectrum: gamma = 1/L for GD and Nesterov, Polyak's values for heavy ball.
+    theta0_grid, theta1_grid = gd.make_grid(grid)
+    Theta0s = np.column_stack([theta0_grid.ravel(), theta1_grid.ravel()])
+    datasets = [('1d_data', XYsamp)] + [('shift={}'.format(s), ill_conditioned_samples(1000, s)) for s in [5,20]]
+    print('{:>10s} {:>9s} {:>10s} {:>10s} {:>10s}'.format('data','cond','optimizer','iters','time [s]'))
+    for name, XY in datasets:
+        problem = lsq.LeastSquares.from_samples(XY)
+        theta_star = problem.solve()
+        mu, L = optimizers.curvature(problem)
+        runs = [('gd', optimizers.GD(1/L)), ('heavyball', optimizers.HeavyBall()),
+                ('nesterov', optimizers.Nesterov()), ('adam', optimizers.Adam(0.01)),
+                ('cg', optimizers.ConjugateGradient())]
+        for label, opt in runs:
+            t, traj = timeit(opt.run, problem, K, Theta0s, repeat=1)
+            iters = optimizers.iterations_to_tolerance(traj, theta_star, tol)
+            iters = iters.max() if (iters>=0).all() else -1
+            print('{:>10s} {:9.1e} {:>10s} {:>10s} {:10.4f}'.format(
+                name, L/mu, label, str(iters) if iters>=0 else '>'+str(K), t))
+
+def bench_closed(XYsamp, K=10**4, gamma=0.01):
+    # Final iterate of a gridN x gridN grid after K steps, iterated and in closed form
+    print('{:>8s} {:>12s} {:>12s} {:>10s}'.format('points','iterate [s]','closed [s]','max diff'))
+    final = gd.OutputPolicy(final_only=True)
+    for gridN in [10,100,1000]:
+        theta0_grid, theta1_grid = gd.make_grid(gridN)
+        t_closed, closed = timeit(gd.run_gd_on_grid, XYsamp, theta0_grid, theta1_grid, K, gamma, final, 'closed')
+        if gridN<=100:
+            t_iter, it = timeit(gd.run_gd_on_grid, XYsamp, theta0_grid, theta1_grid, K, gamma, final, repeat=1)
+            diff = np.abs(it-closed).max()
+        else:
+            t_iter, diff = np.nan, np.nan
+        print('{:8d} {:12.4f} {:12.4f} {:10.1e}'.format(gridN**2, t_iter, t_closed, diff))
+
+def bench_features(XYsamp, batches=(1,64,1024)):
+    # Batched gradients of an (N,d) design: straight from Phi (two GEMMs, O(G N d))
+    # and from the statistics A = Phi^T Phi, b = Phi^T Y (O(N d^2) setup, then O(G d^2))
+    print('{:>8s} {:>4s} {:>6s} {:>12s} {:>12s} {:>12s} {:>10s}'.format(
+        'N','d','batch','setup [s]','design [s]','stats [s]','GFLOP/s'))
+    rng = np.random.default_rng(0)
+    for N in [10**4,10**5]:
+        for d in [50,200,500]:
+            Phi, Y = lsq.sample_design(N, rng.normal(size=d), 0.01, rng=0)
+            t_setup, problem = timeit(lsq.LeastSquares.from_design, Phi, Y)
+            for G in batches:
+                Theta = rng.normal(size=(G,d))
+                t_design, g1 = timeit(lsq.gradients, Phi, Y, Theta)
+                t_stats, g2 = timeit(problem.grad, Theta)
+                assert np.allclose(g1, g2, rtol=1e-6, atol=1e-6*np.abs(g1).max())
+                print('{:8d} {:4d} {:6d} {:12.2e} {:12.2e} {:12.2e} {:10.1f}'.format(
+                    N, d, G, t_setup, t_design, t_stats, 4*G*N*d/t_design/1e9))
+
+benchmarks = {
+    'grid': bench_grid,
+    'gradient': bench_gradient,
+    'solve': bench_solve,
+    'sgd': bench_sgd,
+    'optimizers': bench_optimizers,
+    'closed': bench_closed,
+    'features': bench_features,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for the lab2 least squares routines.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run: {} (default: all)'.format(', '.join(benchmarks)))
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error('unknown benchmark '+name)
+
+    XYsamp = load_data()
+    for name in args.names or benchmarks:
+        print('==', name)
+        benchmarks[name](XYsamp)
+
+if __name__=='__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import shutil
+import tempfile
+import numpy as np
+
+# Result bundles: a lab2 `result` dict saved as a directory instead of a pickle.
+#
+#   <name>.bundle/
+#     index.json          scalars and text inline, a file reference for the rest
+#     <key>.npy           arrays, uncompressed so they load as memory maps
+#     <key>.png/.svg      figures, rendered
+#     <key>/<part>.npy    the data drawn in each figure
+#
+# Reading needs neither pickle nor matplotlib, and Bundle only opens the files
+# of the keys that are accessed.
+
+bundle_format = 'lab2-bundle'
+bundle_version = 1
+
+def is_figure(value):
+    return hasattr(value, 'savefig') and hasattr(value, 'axes')
+
+def file_stem(key, i, used):
+    # Keys are used as file names when they are safe to, otherwise entry<i>.
+    # Stems have no dots, so <stem>.npy, <stem>.png and the <stem>/ folder of
+    # different entries cannot clash, and they are made unique ignoring case
+    # (for case-insensitive filesystems) against the stems in used.
+    stem = key if re.fullmatch(r'[A-Za-z0-9_-]+', key) and key.lower()!='index' else 'entry{}'.format(i)
+    candidate, n = stem, 1
+    while candidate.lower() in used:
+        candidate = '{}-{}'.format(stem, n)
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+def pack_segments(segments):
+    # Ragged list of (n_i,2) arrays as values plus offsets
+    lengths = [len(s) for s in segments]
+    values = np.concatenate([np.reshape(s,(-1,2)) for s in segments]) if segments else np.empty((0,2))
+    return values, np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+def figure_data(fig):
+    # The data behind a figure, as a dict of arrays named ax<i>_<artist><j>_<field>
+    data = {}
+    for i, ax in enumerate(fig.axes):
+        for j, line in enumerate(ax.lines):
+            data['ax{}_line{}_xy'.format(i,j)] = np.asarray(line.get_xydata())
+        for j, coll in enumerate(ax.collections):
+            name = 'ax{}_collection{}_'.format(i,j)
+            if hasattr(coll, 'U'):                  # quiver
+                data[name+'xy'] = np.asarray(coll.get_offsets())
+                data[name+'uv'] = np.column_stack([np.ravel(coll.U), np.ravel(coll.V)])
+            elif hasattr(coll, 'get_segments'):     # LineCollection
+                data[name+'values'], data[name+'offsets'] = pack_segments(coll.get_segments())
+            else:                                   # scatter and the like
+                data[name+'xy'] = np.asarray(coll.get_offsets())
+        for j, image in enumerate(ax.images):
+            data['ax{}_image{}'.format(i,j)] = np.ma.filled(np.ma.asarray(image.get_array(), dtype=float), np.nan)
+            data['ax{}_image{}_extent'.format(i,j)] = np.asarray(image.get_extent(), dtype=float)
+    return data
+
+def jsonable(value):
+    # Plain Python version of value, or raises TypeError
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {k:jsonable(v) for k, v in value.items()}
+    raise TypeError('cannot store {} in a bundle'.format(type(value).__name__))
+
+def save_bundle(result, path, figure_formats=('png','svg'), dpi=100):
+    # Writes the dict result to the directory path, replacing any previous
+    # bundle there. Any other existing file or directory is left alone.
+    path = path.rstrip(os.sep)
+    if os.path.lexists(path) and not is_bundle(path):
+        raise FileExistsError('{} exists and is not a lab2 result bundle'.format(path))
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp_path = tempfile.mkdtemp(prefix='.'+os.path.basename(path)+'.', suffix='.tmp', dir=parent)
+    os.chmod(tmp_path, 0o755)       # mkdtemp makes it private
+    try:
+        entries = {}
+        used = set()
+        for i, (key, value) in enumerate(result.items()):
+            stem = file_stem(key, i, used)
+            if is_figure(value):
+                entry = {'kind':'figure', 'images':{}, 'data':{}}
+                for fmt in figure_formats:
+                    entry['images'][fmt] = stem+'.'+fmt
+                    value.savefig(os.path.join(tmp_path, stem+'.'+fmt), format=fmt, dpi=dpi)
+                os.makedirs(os.path.join(tmp_path, stem), exist_ok=True)
+                for name, array in figure_data(value).items():
+                    entry['data'][name] = os.path.join(stem, name+'.npy')
+                    np.save(os.path.join(tmp_path, entry['data'][name]), array, allow_pickle=False)
+            elif isinstance(value, np.ndarray) and value.dtype!=object:
+                entry = {'kind':'array', 'file':stem+'.npy', 'dtype':value.dtype.str, 'shape':list(value.shape)}
+                np.save(os.path.join(tmp_path, entry['file']), value, allow_pickle=False)
+            else:
+                entry = {'kind':'json', 'value':jsonable(value.tolist() if isinstance(value, np.ndarray) else value)}
+            entries[key] = entry
+
+        with open(os.path.join(tmp_path,'index.json'),'w') as file:
+            json.dump({'format':bundle_format, 'version':bundle_version, 'entries':entries}, file, indent=1)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    if os.path.lexists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+def is_bundle(path):
+    try:
+        with open(os.path.join(path,'index.json')) as file:
+            return os.path.isdir(path) and not os.path.islink(path) and json.load(file).get('format')==bundle_format
+    except (OSError, ValueError, AttributeError):
+        return False
+
+class FigureRecord:
+    # A stored figure: images[fmt] gives the rendered bytes and data[name]
+    # the arrays it was drawn from. Both are read on first access.
+
+    def __init__(self, path, entry, mmap_mode):
+        self.path = path
+        self.entry = entry
+        self.mmap_mode = mmap_mode
+
+    @property
+    def formats(self):
+        return list(self.entry['images'])
+
+    def image(self, fmt='png'):
+        with open(os.path.join(self.path, self.entry['images'][fmt]),'rb') as file:
+            return file.read()
+
+    @property
+    def data(self):
+        return {name:np.load(os.path.join(self.path, file), mmap_mode=self.mmap_mode, allow_pickle=False)
+                for name, file in self.entry['data'].items()}
+
+class Bundle:
+    # Read-only mapping over a bundle directory. Only index.json is read on
+    # open; arrays come back as read-only memory maps unless mmap_mode=None.
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path,'index.json')) as file:
+            index = json.load(file)
+        if index.get('format')!=bundle_format or index.get('version',0)>bundle_version:
+            raise ValueError('{} is not a lab2 result bundle this version can read'.format(path))
+        self.entries = index['entries']
+
+    def keys(self):
+        return self.entries.keys()
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def kind(self, key):
+        return self.entries[key]['kind']
+
+    def __getitem__(self, key):
+        entry = self.entries[key]
+        if entry['kind']=='array':
+            return np.load(os.path.join(self.path, entry['file']), mmap_mode=self.mmap_mode, allow_pickle=False)
+        if entry['kind']=='figure':
+            return FigureRecord(self.path, entry, self.mmap_mode)
+        return entry['value']
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+def load_bundle(path, mmap_mode='r'):
+    return Bundle(path, mmap_mode)
+
+def convert_pickle(source, dest=None, **kwargs):
+    # Turns a <SIDs>.pickle submission into <SIDs>.bundle. Unpickling the
+    # figures needs matplotlib, and the pickle must come from a trusted source.
+    import pickle
+    with open(source,'rb') as file:
+        result = pickle.load(file)
+    dest = dest or os.path.splitext(source)[0]+'.bundle'
+    save_bundle(result, dest, **kwargs)
+    return dest
+
+if __name__=='__main__':
+    import sys
+    for source in sys.argv[1:]:
+        print(source, '->', convert_pickle(source))
@@ -0,0 +1,302 @@
+import numpy as np
+from lsq import as_problem
+
+# Gradient descent on the lab2 least squares problem.
+# A trajectory has one row per iterate: row 0 is the initial condition and
+# row k is the iterate after k steps, so K rows means K-1 updates.
+# Wherever XYsamp is expected, a lsq.LeastSquares problem can be passed instead;
+# the samples are reduced to it once, so each step costs O(1) in N.
+
+def make_grid(gridN):
+    theta_0_array = np.linspace(-1,1,gridN)
+    theta_1_array = np.linspace(-1,1,gridN)
+    return  np.meshgrid(theta_0_array,theta_1_array)
+
+class OutputPolicy:
+    # What a trajectory-producing function stores:
+    #   dtype       storage dtype, e.g. np.float32 (the iteration itself stays float64)
+    #   every       keep iterates 0, every, 2*every, ...; row s is iterate s*every
+    #   final_only  keep only the last iterate
+    #   path        write into a disk-backed .npy memmap at this path instead of RAM;
+    #               the file has the shape of the returned array
+    # The default keeps every iterate in float64, as the lab specifies. Iterates
+    # that were not kept can be recomputed with gd_iterate / gd_expand.
+
+    def __init__(self, dtype=np.float64, every=1, final_only=False, path=None):
+        self.dtype = dtype
+        self.every = every
+        self.final_only = final_only
+        self.path = path
+
+    def kept(self, K):
+        # Indices of the iterates that are stored, out of K
+        if self.final_only:
+            return np.array([K-1])
+        return np.arange(0, K, self.every)
+
+    def allocate(self, shape):
+        if self.path is not None:
+            return np.lib.format.open_memmap(self.path, mode='w+', dtype=self.dtype, shape=shape)
+        return np.empty(shape, dtype=self.dtype)
+
+def gradient_descent(XYsamp,K,gamma,Theta0,output=None,gtol=None,xtol=None,stop_divergent=False,method='iterate'):
+    # (K,2) trajectory; see OutputPolicy for the other layouts and step_size for
+    # the values gamma can take. With gtol, xtol or stop_divergent the run
+    # stops early (see gradient_descent_packed) and has at most K rows; with
+    # stop_divergent the result is (trajectory, diverged) so the flag is not lost.
+    # method='closed' evaluates the iterates directly, see gd_closed_form.
+    Theta0s = np.reshape(Theta0,(1,-1))
+    if gtol is not None or xtol is not None or stop_divergent:
+        if output is not None or method!='iterate':
+            raise ValueError('early stopping only supports iterating with the default output policy')
+        packed = gradient_descent_packed(XYsamp,K,gamma,Theta0s,gtol,xtol,stop_divergent)
+        if stop_divergent:
+            return packed[0], bool(packed.diverged[0])
+        return packed[0]
+    return gradient_descent_batch(XYsamp,K,gamma,Theta0s,output,method)[0]
+
+def gradient_descent_batch(XYsamp,K,gamma,Theta0s,output=None,method='iterate',out=None):
+    # Advances every start point at once. Theta0s has shape (G,2) and the
+    # result (G,K,2); trajectory g matches gradient_descent(XYsamp,K,gamma,Theta0s[g]).
+    # gamma may also be an array of G steps, gamma[g] for run g.
+    # out: an array of the result shape to fill instead of allocating one.
+    problem = as_problem(XYsamp)
+    gamma = step_size(problem, gamma)
+    output = output or OutputPolicy()
+    kept = output.kept(K)
+    Theta = np.array(Theta0s, dtype=float)
+    traj = output.allocate((Theta.shape[0],len(kept),Theta.shape[1])) if out is None else out
+    if method=='closed':
+        # Chunks of start points keep the temporaries around 2**22 values
+        chunk = max(1, 2**22//(len(kept)*Theta.shape[1]))
+        for lo in range(0, len(Theta), chunk):
+            gammas = gamma[lo:lo+chunk] if isinstance(gamma, np.ndarray) else gamma
+            traj[lo:lo+chunk] = gd_closed_form(problem, Theta[lo:lo+chunk], gammas, kept)
+        return traj
+    if method!='iterate':
+        raise ValueError('unknown method '+repr(method))
+    slot = 0
+    for k in range(K):
+        if slot<len(kept) and kept[slot]==k:
+            traj[:,slot] = Theta
+            slot += 1
+        if k<K-1:
+            grad = problem.grad(Theta)
+            Theta -= line_search(problem, grad, gamma)*grad
+    return traj
+
+def run_gd_on_grid(XYsamp,theta0_grid,theta1_grid,K,gamma,output=None,method='iterate'):
+    # Returns an array of shape theta0_grid.shape+(K,2), e.g. (5,5,K,2) for the 5x5 grid
+    # With OutputPolicy(path=...) the file on disk has this grid layout too.
+    Theta0s = np.column_stack([np.ravel(theta0_grid), np.ravel(theta1_grid)])
+    output = output or OutputPolicy()
+    traj = output.allocate(np.shape(theta0_grid)+(len(output.kept(K)),Theta0s.shape[1]))
+    gradient_descent_batch(XYsamp,K,gamma,Theta0s,output,method,out=traj.reshape((len(Theta0s),)+traj.shape[-2:]))
+    return traj
+
+# Closed form #################################################################
+# With a fixed step the error e_k = theta_k - theta* obeys e_{k+1} = (I - 2 gamma A) e_k,
+# so in the eigenbasis A = Q diag(lambda) Q^T
+#   theta_k = theta* + Q diag((1 - 2 gamma lambda)^k) Q^T (theta_0 - theta*).
+# Any iterate then costs O(d^2) whatever k. It agrees with the iterations up to
+# rounding, relative to the size of the iterates (which overflow alike when
+# gamma is past max_stable_step).
+
+def gd_closed_form(XYsamp,Theta0s,gamma,ks):
+    # Iterates ks (S,) of the runs from Theta0s (G,d), as a (G,S,d) array.
+    # gamma is a number or one step per run, shape (G,).
+    problem = as_problem(XYsamp)
+    gamma = step_size(problem, gamma)
+    if isinstance(gamma, (str, tuple)):
+        raise ValueError('the closed form needs a fixed step size')
+    lam, Q = np.linalg.eigh(problem.A)
+    theta_star = problem.solve()
+    E0 = (np.asarray(Theta0s, dtype=float)-theta_star)@Q                    # (G,d)
+    factors = 1-2*np.reshape(gamma,(-1,1))*lam                               # (G or 1,d)
+    with np.errstate(over='ignore', invalid='ignore'):
+        powers = factors[:,None,:]**np.asarray(ks)[None,:,None]              # (G or 1,S,d)
+        return theta_star + (E0[:,None,:]*powers)@Q.T
+
+# Step sizes ##################################################################
+# The Hessian of J is 2A with A = Phi^T Phi, so a fixed step gamma multiplies the
+# error along the eigenvector of eigenvalue lambda by 1-2*gamma*lambda at every
+# step: GD converges iff gamma < 1/lambda_max(A) (for 1d_data, gamma=0.2 in
+# part 3c and 0.7 in part 3f are past it). gamma can be given as a number or as a rule:
+#   'optimal'       1/(lambda_max+lambda_min), the fastest fixed step
+#   'lipschitz'     1/(2 lambda_max), the classical 1/L step
+#   'exact'         exact line search, t = g^T g / (2 g^T A g) for the gradient g
+#   'backtracking'  Armijo backtracking: t0 = 1/(2 lambda_min) halved until
+#                   J(theta - t g) <= J(theta) - t/2 |g|^2
+
+def max_stable_step(XYsamp):
+    # Fixed steps below this converge, steps at or above it do not
+    return 1/np.linalg.eigvalsh(as_problem(XYsamp).A)[-1]
+
+def step_size(problem, gamma):
+    # Turns the fixed step rules into numbers; line search rules are kept as is
+    # An array gives one step per run and becomes a (G,1) column
+    if isinstance(gamma, tuple):
+        return gamma        # already resolved
+    if not isinstance(gamma, str):
+        return gamma if np.ndim(gamma)==0 else np.reshape(np.asarray(gamma, dtype=float), (-1,1))
+    eigs = np.linalg.eigvalsh(problem.A)
+    if gamma=='optimal':
+        return 1/(eigs[-1]+eigs[0])
+    if gamma=='lipschitz':
+        return 1/(2*eigs[-1])
+    if gamma=='exact':
+        return gamma
+    if gamma=='backtracking':
+        return ('backtracking', 1/(2*eigs[0] if eigs[0]>0 else 2*eigs[-1]))
+    raise ValueError('unknown step size rule '+repr(gamma))
+
+def line_search(problem, grad, gamma):
+    # Step for each row of grad: gamma itself if it is a number, else a (G,1) column
+    if not isinstance(gamma, (str, tuple)):
+        return gamma
+    gg = np.einsum('...i,...i->...', grad, grad)
+    gAg = np.einsum('...i,ij,...j->...', grad, problem.A, grad)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exact = np.where(gAg>0, gg/(2*gAg), 0)
+    if gamma=='exact':
+        return exact[...,None]
+    # J(theta - t g) - J(theta) = -t g^T g + t^2 g^T A g, so the Armijo condition
+    # holds iff t <= exact and the halving loop stops after a known number of halvings
+    t0 = gamma[1]
+    with np.errstate(divide='ignore'):
+        halvings = np.maximum(np.ceil(np.log2(t0/exact)), 0)
+    return np.where(exact>0, t0*0.5**halvings, 0)[...,None]
+
+# Early stopping ##############################################################
+
+class PackedTrajectories:
+    # Trajectories of different lengths stored back to back: run g is
+    # values[offsets[g]:offsets[g+1]], and offsets has one entry more than there are runs.
+    # diverged flags the runs aborted by stop_divergent.
+
+    def __init__(self, values, offsets, diverged=None):
+        self.values = values
+        self.offsets = offsets
+        self.diverged = np.zeros(len(offsets)-1, dtype=bool) if diverged is None else diverged
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self, g):
+        return self.values[self.offsets[g]:self.offsets[g+1]]
+
+    def final(self):
+        # (G,2) last iterate of every run
+        return self.values[self.offsets[1:]-1]
+
+    def to_dense(self, K=None, shape=None, fill=None):
+        # (G,K,2) array, or shape+(K,2) to get the run_gd_on_grid layout back.
+        # Runs that stopped early are padded with their last iterate, which
+        # is what the full run would have kept returning up to the tolerance,
+        # or with the constant fill (e.g. np.nan) to mark the padding.
+        lengths = self.lengths
+        K = lengths.max() if K is None else K
+        k = np.minimum(np.arange(K), lengths[:,None]-1)
+        dense = self.values[self.offsets[:-1,None]+k]
+        if fill is not None:
+            dense[np.arange(K)>=lengths[:,None]] = fill
+        return dense.reshape(((len(self),) if shape is None else tuple(shape))+dense.shape[-2:])
+
+def gradient_descent_packed(XYsamp,K,gamma,Theta0s,gtol=None,xtol=None,stop_divergent=False):
+    # Like gradient_descent_batch, but run g stops at the first iterate k with
+    # ||nablaJ(theta_k)|| <= gtol or ||theta_k - theta_{k-1}|| <= xtol, which is
+    # its last stored row. Only the runs still going are updated, so finished
+    # runs cost nothing. Returns a PackedTrajectories of at most K rows per run.
+    #
+    # With stop_divergent, a run is also stopped, and flagged in .diverged, at
+    # the first iterate whose error e = theta - theta* grows in the A norm
+    # sqrt(e^T A e) past its initial value, or that is not finite. That norm
+    # never increases for a convergent fixed step or a line search, so with a
+    # step past max_stable_step the run is caught after a few steps, long
+    # before it overflows.
+    problem = as_problem(XYsamp)
+    gamma = step_size(problem, gamma)
+    Theta = np.array(Theta0s, dtype=float)
+    G = Theta.shape[0]
+    active = np.arange(G)
+    lengths = np.zeros(G, dtype=int)
+    diverged = np.zeros(G, dtype=bool)
+    steps = []
+    grad = problem.grad(Theta)
+    if stop_divergent:
+        theta_star = problem.solve()
+        energy = lambda T: np.einsum('...i,ij,...j->...', T-theta_star, problem.A, T-theta_star)
+        limit = energy(Theta)*(1+1e-9) + 1e-300
+    for k in range(K):
+        steps.append((active, Theta))
+        lengths[active] += 1
+        if k==K-1:
+            break
+        done = np.zeros(len(active), dtype=bool)
+        if gtol is not None:
+            done |= np.linalg.norm(grad, axis=-1)<=gtol
+        if xtol is not None and k>0:
+            done |= np.linalg.norm(step, axis=-1)<=xtol
+        if stop_divergent and k>0:
+            blown = ~(energy(Theta)<=limit)
+            diverged[active[blown]] = True
+            done |= blown
+        if done.any():
+            keep = ~done
+            active, Theta, grad = active[keep], Theta[keep], grad[keep]
+            if isinstance(gamma, np.ndarray):
+                gamma = gamma[keep]
+            if stop_divergent:
+                limit = limit[keep]
+            if not len(active):
+                break
+        step = line_search(problem, grad, gamma)*grad
+        Theta = Theta-step
+        grad = problem.grad(Theta)
+
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    values = np.empty((offsets[-1],Theta.shape[-1]))
+    for k, (rows, Theta) in enumerate(steps):
+        values[offsets[rows]+k] = Theta
+    return PackedTrajectories(values, offsets, diverged)
+
+def run_gd_on_grid_packed(XYsamp,theta0_grid,theta1_grid,K,gamma,gtol=None,xtol=None,stop_divergent=False):
+    # Early stopping version of run_gd_on_grid; runs are in np.ravel order.
+    # .to_dense(K, np.shape(theta0_grid)) gives the (gridN,gridN,K,2) layout back.
+    Theta0s = np.column_stack([np.ravel(theta0_grid), np.ravel(theta1_grid)])
+    return gradient_descent_packed(XYsamp,K,gamma,Theta0s,gtol,xtol,stop_divergent)
+
+# Replay ######################################################################
+# GD is deterministic, so iterates dropped by an OutputPolicy(every=...) are
+# recomputed by running the same update from the nearest stored checkpoint. With
+# float64 storage the result is bit-identical to the full run; with float32
+# storage it restarts from the rounded checkpoint.
+
+def gd_iterate(XYsamp,gamma,stored,every,k):
+    # Iterate k of every run in stored (...,S,2), where row s is iterate s*every
+    s = k//every
+    start = np.reshape(stored[...,s,:], (-1,stored.shape[-1])).astype(float)
+    theta = gradient_descent_batch(XYsamp,k-s*every+1,gamma,start,OutputPolicy(final_only=True))
+    return theta.reshape(stored.shape[:-2]+stored.shape[-1:])
+
+def gd_expand(XYsamp,gamma,stored,every,K):
+    # Full (...,K,2) float64 trajectories from checkpoints stored (...,S,2).
+    # All segments are replayed together as one batch.
+    S, d = stored.shape[-2:]
+    starts = np.reshape(stored, (-1,d)).astype(float)
+    segments = gradient_descent_batch(XYsamp,every,gamma,starts)
+    full = segments.reshape(stored.shape[:-2]+(S*every,d))
+    return full[...,:K,:]
+
+def run_gd_on_grid_loop(XYsamp,theta0_grid,theta1_grid,K,gamma):
+    # One gradient_descent call per start point. Kept as the reference for run_gd_on_grid.
+    problem = as_problem(XYsamp)
+    trajectories = np.empty(np.shape(theta0_grid)+(K,2))
+    for idx in np.ndindex(np.shape(theta0_grid)):
+        Theta0 = np.array([theta0_grid[idx], theta1_grid[idx]])
+        trajectories[idx] = gradient_descent(problem,K,gamma,Theta0)
+    return trajectories
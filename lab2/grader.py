@@ -0,0 +1,217 @@
+import os
+import sys
+import csv
+import time
+import pickle
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from lsq import solve_lr, nablaJ
+from gd import make_grid, gradient_descent, run_gd_on_grid
+from bundle import Bundle
+
+# Grades lab2 submissions, <SIDs>.pickle files or <SIDs>.bundle directories,
+# against reference answers. Submissions are loaded in a process pool, each
+# answer is stacked over all submissions and checked with one np.isclose.
+
+this_folder = os.path.dirname(os.path.realpath(__file__))
+
+graded_keys = ['theta_2a', 'nablaJ_3a_a', 'nablaJ_3a_b', 'gd_3b_a', 'gd_3b_b', 'grid_3c']
+
+# Loading #####################################################################
+# Submissions are untrusted: unpickling one may only build numpy arrays and
+# builtin containers. Any other global (matplotlib figures, but also os.system
+# and friends) is replaced by an inert Placeholder.
+
+allowed_globals = {
+    ('builtins', name) for name in ['list', 'dict', 'tuple', 'set', 'frozenset', 'int', 'float',
+                                    'complex', 'bool', 'str', 'bytes', 'bytearray', 'slice']
+} | {
+    ('collections', 'OrderedDict'),
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', 'scalar'),
+    ('numpy.core.numeric', '_frombuffer'),       # arrays in protocol 5 pickles
+    ('numpy._core.numeric', '_frombuffer'),
+    ('_codecs', 'encode'),                       # bytes in protocol 0-2 pickles
+}
+
+class Placeholder:
+    # Stands for an object of a disallowed class. It accepts whatever the
+    # pickle does to it and keeps nothing.
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return Placeholder()
+
+    def __setstate__(self, state):
+        pass
+
+    def __setitem__(self, key, value):
+        pass
+
+    def append(self, value):
+        pass
+
+    def extend(self, values):
+        pass
+
+class RestrictedUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        if (module, name) in allowed_globals or (module.startswith('numpy') and name.endswith('DType')):
+            return super().find_class(module, name)
+        return Placeholder
+
+def restricted_load(file):
+    return RestrictedUnpickler(file).load()
+
+def load_result(path):
+    if os.path.isdir(path):
+        return Bundle(path, mmap_mode=None)
+    with open(path,'rb') as file:
+        return restricted_load(file)
+
+def has_placeholder(value):
+    if isinstance(value, Placeholder):
+        return True
+    if isinstance(value, (list, tuple)):
+        return any(has_placeholder(v) for v in value)
+    if isinstance(value, np.ndarray) and value.dtype==object:
+        return any(has_placeholder(v) for v in value.flat)
+    return False
+
+def load_submission(path, shapes):
+    # (answers, SIDs, error): answers[key] is a float array of the reference
+    # shape, or None when the key is missing or malformed. Answers built from
+    # disallowed objects score 0 and are named in the error.
+    try:
+        result = load_result(path)
+    except Exception as error:
+        return {key:None for key in shapes}, '', '{}: {}'.format(type(error).__name__, error)
+    answers = {}
+    blocked = []
+    for key, shape in shapes.items():
+        try:
+            value = result[key]
+        except Exception:
+            answers[key] = None
+            continue
+        if has_placeholder(value):
+            blocked.append(key)
+            answers[key] = None
+            continue
+        try:
+            answer = np.asarray(value, dtype=float)
+            answers[key] = answer if answer.shape==shape else None
+        except Exception:
+            answers[key] = None
+    try:
+        sids = '_'.join(str(sid) for sid in result['SIDs'])
+    except Exception:
+        sids = ''
+    error = 'disallowed objects in: '+', '.join(blocked) if blocked else ''
+    return answers, sids, error
+
+def load_submissions(paths, shapes, workers=1):
+    if workers>1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(load_submission, paths, [shapes]*len(paths),
+                                 chunksize=max(1,len(paths)//(4*workers))))
+    return [load_submission(path, shapes) for path in paths]
+
+def find_submissions(paths):
+    # Directories that are not bundles are searched for submissions
+    found = []
+    for path in paths:
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path,'index.json')):
+            found += sorted(os.path.join(path,name) for name in os.listdir(path)
+                            if name.endswith(('.pickle','.bundle')))
+        else:
+            found.append(path)
+    return found
+
+# Reference ###################################################################
+
+def reference_answers(XYsamp):
+    # The answers of the graded cells of lab2_handout.ipynb
+    theta0_grid, theta1_grid = make_grid(5)
+    return {
+        'theta_2a': solve_lr(XYsamp),
+        'nablaJ_3a_a': nablaJ(XYsamp,0.5,-1),
+        'nablaJ_3a_b': nablaJ(XYsamp,1.1,0.6),
+        'gd_3b_a': gradient_descent(XYsamp,10,0.1,np.array([-0.5,0.5])),
+        'gd_3b_b': gradient_descent(XYsamp,20,0.01,np.array([0.5,-0.5])),
+        'grid_3c': run_gd_on_grid(XYsamp,theta0_grid,theta1_grid,K=200,gamma=0.2),
+    }
+
+def load_reference(path=None):
+    # From a trusted result file, or computed from 1d_data.pickle
+    if path is None:
+        with open(os.path.join(this_folder,'1d_data.pickle'),'rb') as file:
+            return reference_answers(pickle.load(file))
+    result = load_result(path)
+    return {key:np.asarray(result[key], dtype=float) for key in graded_keys}
+
+# Scoring #####################################################################
+
+def score(submissions, reference, rtol=1e-5, atol=1e-8):
+    # Boolean array (n_submissions,) per key
+    scores = {}
+    for key, expected in reference.items():
+        stacked = np.full((len(submissions),)+expected.shape, np.nan)
+        present = np.zeros(len(submissions), dtype=bool)
+        for i, (answers, sids, error) in enumerate(submissions):
+            if answers[key] is not None:
+                stacked[i] = answers[key]
+                present[i] = True
+        close = np.isclose(stacked, expected, rtol=rtol, atol=atol, equal_nan=True)
+        scores[key] = present & close.reshape(len(submissions),-1).all(axis=1)
+    return scores
+
+def write_csv(path, paths, submissions, scores):
+    with open(path,'w',newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['file','SIDs']+list(scores)+['total','error'])
+        for i, (source, (answers, sids, error)) in enumerate(zip(paths, submissions)):
+            marks = [int(scores[key][i]) for key in scores]
+            writer.writerow([os.path.basename(source.rstrip(os.sep)), sids]+marks+[sum(marks), error])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Grade lab2 result files against the reference answers.')
+    parser.add_argument('submissions', nargs='+',
+                        help='.pickle files, .bundle directories, or folders containing them')
+    parser.add_argument('--reference', help='trusted result file with the expected answers '
+                                            '(default: computed from 1d_data.pickle)')
+    parser.add_argument('-o', '--output', default='grades.csv')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='loader processes')
+    parser.add_argument('--rtol', type=float, default=1e-5)
+    parser.add_argument('--atol', type=float, default=1e-8)
+    args = parser.parse_args(argv)
+
+    reference = load_reference(args.reference)
+    paths = find_submissions(args.submissions)
+
+    tic = time.perf_counter()
+    submissions = load_submissions(paths, {key:value.shape for key, value in reference.items()}, args.jobs)
+    load_time = time.perf_counter()-tic
+    tic = time.perf_counter()
+    scores = score(submissions, reference, args.rtol, args.atol)
+    score_time = time.perf_counter()-tic
+    write_csv(args.output, paths, submissions, scores)
+
+    failed = sum(1 for answers, sids, error in submissions if error)
+    print('{} submissions ({} with errors) -> {}'.format(len(paths), failed, args.output))
+    print('load  {:.3f}s ({:.0f} files/s, {} processes)'.format(load_time, len(paths)/max(load_time,1e-9), args.jobs))
+    print('score {:.3f}s'.format(score_time))
+    for key, passed in scores.items():
+        print('  {:12s} {:6.1%}'.format(key, passed.mean() if len(passed) else 0))
+
+if __name__=='__main__':
+    main(sys.argv[1:])
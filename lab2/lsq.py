@@ -0,0 +1,305 @@
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from concurrent.futures import ProcessPoolExecutor
+
+# Least squares fit of y = theta0 + theta1*x to the samples XYsamp (an (N,2) array
+# with x in column 0 and y in column 1). Shared by gd.py and the lab2 notebook.
+# Everything from solve_design on also takes a general (N,d) design matrix Phi,
+# with parameter vectors of length d; see the Features section for building one.
+
+def sampleXY(N, theta0, theta1, sigma2_eps, rng=None):
+    # N iid samples of X ~ U(0,1), Y = theta0 + theta1*X + eps with eps ~ N(0,sigma2_eps)
+    rng = np.random.default_rng(rng)
+    X = rng.uniform(0,1,N)
+    return np.column_stack([X, theta0 + theta1*X + rng.normal(0,np.sqrt(sigma2_eps),N)])
+
+def sample_design(N, theta, sigma2_eps, rng=None):
+    # d = len(theta) version of sampleXY: Phi = [1, X] with X ~ U(0,1)^(d-1) and
+    # Y = Phi theta + eps. Returns (Phi, Y).
+    rng = np.random.default_rng(rng)
+    theta = np.asarray(theta, dtype=float)
+    Phi = np.empty((N,len(theta)))
+    Phi[:,0] = 1
+    Phi[:,1:] = rng.uniform(0,1,(N,len(theta)-1))
+    return Phi, Phi@theta + rng.normal(0,np.sqrt(sigma2_eps),N)
+
+def design_matrix(XYsamp, degree=1):
+    # Phi = [1, x] and Y, as in section 2 of the lab; [1, x, ..., x^degree] for degree > 1
+    XYsamp = np.asarray(XYsamp, dtype=float)
+    return polynomial_features(XYsamp[:,0], degree), XYsamp[:,1]
+
+def solve_design(Phi, Y, method='auto'):
+    # Least squares solution of Phi theta = Y.
+    #   'inv'       (Phi^T Phi)^-1 Phi^T Y, the part 2a formula
+    #   'cholesky'  Cholesky factorization of the normal equations; fastest, but
+    #               its accuracy depends on cond(Phi)^2
+    #   'qr'        QR factorization of Phi; accuracy depends on cond(Phi)
+    #   'lstsq'     SVD based; also handles rank deficient Phi (minimum norm solution)
+    #   'auto'      picks one of the three above from the conditioning of Phi
+    A = Phi.T@Phi if method in ('auto','inv','cholesky') else None
+    if method=='auto':
+        method = choose_method(A)
+    if method=='inv':
+        return np.linalg.inv(A) @ Phi.T @ Y
+    if method=='cholesky':
+        return cho_solve(cho_factor(A), Phi.T@Y)
+    if method=='qr':
+        Q, R = np.linalg.qr(Phi)
+        return solve_triangular(R, Q.T@Y)
+    if method=='lstsq':
+        return np.linalg.lstsq(Phi, Y, rcond=None)[0]
+    raise ValueError('unknown method '+repr(method))
+
+def choose_method(A):
+    # cond(Phi) = sqrt(cond(Phi^T Phi)). Cholesky loses about twice as many digits
+    # as QR, so it is only used while cond(Phi) < 1e4 (at most ~8 digits lost).
+    # Past 1e12 Phi is treated as numerically rank deficient.
+    eigs = np.linalg.eigvalsh(A)
+    if eigs[0]<=0:
+        return 'lstsq'
+    cond = np.sqrt(eigs[-1]/eigs[0])
+    if cond<1e4:
+        return 'cholesky'
+    if cond<1e12:
+        return 'qr'
+    return 'lstsq'
+
+def solve_lr(XYsamp, method='auto', degree=1):
+    # Least squares estimate [theta0, theta1]; see solve_design for the methods
+    # and design_matrix for degree
+    Phi, Y = design_matrix(XYsamp, degree)
+    return solve_design(Phi, Y, method)
+
+def nablaJ(XYsamp, theta0, theta1):
+    # Gradient of J = sum_n (theta0 + theta1*x_n - y_n)^2
+    Phi, Y = design_matrix(XYsamp)
+    return 2*Phi.T @ (Phi @ np.array([theta0,theta1]) - Y)
+
+def gradients(Phi, Y, Theta):
+    # Gradient of ||Phi theta - Y||^2 for each row of Theta (G,d), as two GEMMs
+    # costing O(G N d). When the same data is used for more than about d
+    # evaluations, LeastSquares.from_design(Phi, Y).grad is cheaper: O(N d^2)
+    # once, then O(G d^2).
+    return 2*((Theta@Phi.T - Y)@Phi)
+
+class LeastSquares:
+    # J(theta) = ||Phi theta - Y||^2 kept as its sufficient statistics
+    # A = Phi^T Phi, b = Phi^T Y and c = Y^T Y. Once they are built, gradients
+    # and losses cost O(d^2) per evaluation whatever the number of samples.
+
+    def __init__(self, A, b, c, N):
+        self.A = np.asarray(A, dtype=float)
+        self.b = np.asarray(b, dtype=float)
+        self.c = float(c)
+        self.N = int(N)
+
+    @classmethod
+    def from_design(cls, Phi, Y):
+        return cls(Phi.T@Phi, Phi.T@Y, Y@Y, len(Y))
+
+    @classmethod
+    def from_samples(cls, XYsamp):
+        # Same as from_design(*design_matrix(XYsamp)) without building Phi
+        X = np.asarray(XYsamp[:,0], dtype=float)
+        Y = np.asarray(XYsamp[:,1], dtype=float)
+        Sx, Sy = X.sum(), Y.sum()
+        return cls([[len(X),Sx],[Sx,X@X]], [Sy,X@Y], Y@Y, len(X))
+
+    def __add__(self, other):
+        # Statistics of the union of two datasets
+        return LeastSquares(self.A+other.A, self.b+other.b, self.c+other.c, self.N+other.N)
+
+    def solve(self, method='auto'):
+        # Minimizer of J from the normal equations. Only A and b are kept, so
+        # 'qr' is not available; 'lstsq' gives the minimum norm solution.
+        if method=='auto':
+            method = 'lstsq' if choose_method(self.A)=='lstsq' else 'cholesky'
+        if method=='inv':
+            return np.linalg.inv(self.A) @ self.b
+        if method=='cholesky':
+            return cho_solve(cho_factor(self.A), self.b)
+        if method=='lstsq':
+            return np.linalg.lstsq(self.A, self.b, rcond=None)[0]
+        raise ValueError('unknown method '+repr(method))
+
+    @property
+    def d(self):
+        return len(self.b)
+
+    def grad(self, Theta):
+        # Theta has shape (...,d); one gradient per row
+        return 2*(Theta@self.A - self.b)
+
+    def loss(self, Theta):
+        # Computed as theta^T A theta - 2 b^T theta + c, which loses relative
+        # accuracy near the optimum when the residuals are tiny
+        return np.einsum('...i,ij,...j->...', Theta, self.A, Theta) - 2*Theta@self.b + self.c
+
+    def nablaJ(self, theta0, theta1):
+        return self.grad(np.array([theta0,theta1]))
+
+def as_problem(data):
+    # Accepts the (N,2) samples, a (Phi, Y) pair or a LeastSquares instance
+    if isinstance(data, LeastSquares):
+        return data
+    if isinstance(data, tuple):
+        return LeastSquares.from_design(*data)
+    return LeastSquares.from_samples(data)
+
+def gradient_field(XYsamp, theta0_grid, theta1_grid, chunk_size=2**20):
+    # nablaJ at every grid point, as two arrays U, V shaped like the grids.
+    # The gradient is affine in theta, so each chunk is a couple of broadcast
+    # operations; chunking only bounds the size of the temporaries.
+    problem = as_problem(XYsamp)
+    A, b = problem.A, problem.b
+    T0 = np.ravel(theta0_grid)
+    T1 = np.ravel(theta1_grid)
+    U = np.empty(T0.shape)
+    V = np.empty(T0.shape)
+    for lo in range(0, len(T0), chunk_size):
+        t0, t1 = T0[lo:lo+chunk_size], T1[lo:lo+chunk_size]
+        U[lo:lo+chunk_size] = 2*(A[0,0]*t0 + A[0,1]*t1 - b[0])
+        V[lo:lo+chunk_size] = 2*(A[1,0]*t0 + A[1,1]*t1 - b[1])
+    return U.reshape(np.shape(theta0_grid)), V.reshape(np.shape(theta0_grid))
+
+# Features ####################################################################
+# Basis expansions of the inputs. X is (N,) for a scalar input or (N,p); the
+# result is an (N,d) design matrix with a leading column of ones.
+
+def polynomial_features(X, degree):
+    # [1, x, ..., x^degree] for each input column (no cross terms): d = 1 + p*degree
+    X = np.asarray(X, dtype=float).reshape(len(X),-1)
+    Phi = np.empty((len(X), 1+X.shape[1]*degree))
+    Phi[:,0] = 1
+    power = np.ones_like(X)
+    for k in range(degree):
+        power = power*X
+        Phi[:,1+k*X.shape[1]:1+(k+1)*X.shape[1]] = power
+    return Phi
+
+def rbf_features(X, centers, width):
+    # [1, exp(-|x - c_j|^2 / (2 width^2)) for each center c_j]: d = 1 + len(centers)
+    X = np.asarray(X, dtype=float).reshape(len(X),-1)
+    C = np.asarray(centers, dtype=float).reshape(len(centers),-1)
+    sq = (X**2).sum(1)[:,None] - 2*X@C.T + (C**2).sum(1)      # |x - c|^2 as one GEMM
+    return np.column_stack([np.ones(len(X)), np.exp(-np.maximum(sq,0)/(2*width**2))])
+
+# Streaming samples ###########################################################
+# Rows are generated in fixed blocks of sample_block_rows, block b from its own
+# stream SeedSequence(seed, spawn_key=(b,)). Row n is therefore the same whatever
+# the chunk size it is requested with, and the first N rows do not depend on N.
+
+sample_block_rows = 2**16
+
+def sample_block(b, theta0, theta1, sigma2_eps, seed, dtype):
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(b,)))
+    block = np.empty((sample_block_rows,2), dtype=dtype)
+    block[:,0] = rng.random(sample_block_rows, dtype=dtype)
+    block[:,1] = rng.standard_normal(sample_block_rows, dtype=dtype)
+    block[:,1] *= np.sqrt(sigma2_eps)
+    block[:,1] += theta0 + theta1*block[:,0]
+    return block
+
+def sample_rows(lo, hi, theta0, theta1, sigma2_eps, seed=0, dtype=np.float64):
+    # Rows lo:hi of the sample sequence
+    out = np.empty((hi-lo,2), dtype=dtype)
+    B = sample_block_rows
+    for b in range(lo//B, (hi-1)//B+1):
+        start, stop = max(lo,b*B), min(hi,(b+1)*B)
+        out[start-lo:stop-lo] = sample_block(b, theta0, theta1, sigma2_eps, seed, dtype)[start-b*B:stop-b*B]
+    return out
+
+def sampleXY_chunks(N, theta0, theta1, sigma2_eps, seed=0, chunk_rows=2**20, dtype=np.float64):
+    # Yields the N samples as consecutive (<=chunk_rows, 2) arrays. dtype may be
+    # np.float32 to halve the memory and disk footprint.
+    for lo in range(0, N, chunk_rows):
+        yield sample_rows(lo, min(lo+chunk_rows,N), theta0, theta1, sigma2_eps, seed, dtype)
+
+def sampleXY_to_npy(path, N, theta0, theta1, sigma2_eps, seed=0, chunk_rows=2**20, dtype=np.float64):
+    # Writes the samples chunk by chunk into a memory-mapped .npy file, readable
+    # with open_samples / solve_lr_stream
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(N,2))
+    lo = 0
+    for chunk in sampleXY_chunks(N, theta0, theta1, sigma2_eps, seed, chunk_rows, dtype):
+        out[lo:lo+len(chunk)] = chunk
+        lo += len(chunk)
+    out.flush()
+    del out
+    return path
+
+# Out-of-core fitting #########################################################
+# Samples stored on disk are read through np.memmap in fixed-size chunks, so
+# memory use depends on chunk_rows and not on the size of the file.
+
+def open_samples(path, dtype=np.float64):
+    # .npy files carry their own dtype and shape; anything else is raw (N,2) binary of `dtype`
+    if str(path).endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=dtype, mode='r').reshape(-1,2)
+
+def stream_rows(path, start, stop, chunk_rows=2**20, dtype=np.float64):
+    # Statistics of rows start:stop. Runs in worker processes, so it opens the file itself.
+    XY = open_samples(path, dtype)
+    problem = LeastSquares(np.zeros((2,2)), np.zeros(2), 0.0, 0)
+    for lo in range(start, stop, chunk_rows):
+        problem = problem + LeastSquares.from_samples(XY[lo:min(lo+chunk_rows,stop)])
+    return problem
+
+def stream_problem(path, chunk_rows=2**20, workers=1, dtype=np.float64):
+    N = len(open_samples(path, dtype))
+    if workers<=1:
+        return stream_rows(path, 0, N, chunk_rows, dtype)
+
+    # Contiguous row ranges, one per worker; the partial sums are added at the end
+    bounds = np.linspace(0, N, workers+1).astype(int)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(stream_rows, [path]*workers, bounds[:-1], bounds[1:],
+                         [chunk_rows]*workers, [dtype]*workers)
+        return sum(parts, LeastSquares(np.zeros((2,2)), np.zeros(2), 0.0, 0))
+
+def solve_lr_stream(path, chunk_rows=2**20, workers=1, dtype=np.float64, method='auto'):
+    # solve_lr for samples in a .npy or raw binary file that need not fit in memory
+    return stream_problem(path, chunk_rows, workers, dtype).solve(method)
+
+# Section 4: zero sets of the per-sample losses ##############################
+# l_n = 0 is the line theta0 + x_n*theta1 = y_n in the parameter plane. Two such
+# lines meet where the model passes exactly through both samples.
+
+def intersection_blocks(XYsamp, chunk_size=2**22):
+    # Yields (keep, theta0, theta1) for blocks of rows i against columns j:
+    # theta0/theta1 hold the intersection of lines i and j and keep marks the
+    # pairs with j > i that are not parallel (equal x). Each block has about
+    # chunk_size entries.
+    X = np.asarray(XYsamp[:,0], dtype=float)
+    Y = np.asarray(XYsamp[:,1], dtype=float)
+    N = len(X)
+    rows = max(1, chunk_size//max(N,1))
+    for lo in range(0, N-1, rows):
+        hi = min(lo+rows, N-1)
+        # Rows i = lo..hi-1 against columns j = lo+1..N-1; j > i is the upper triangle
+        upper = np.arange(N-lo-1)[None,:] >= np.arange(hi-lo)[:,None]
+        dx = X[lo:hi,None]-X[None,lo+1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            theta1 = (Y[lo:hi,None]-Y[None,lo+1:])/dx
+        theta0 = Y[lo:hi,None]-X[lo:hi,None]*theta1
+        yield upper & (dx!=0), theta0, theta1
+
+def line_intersections(XYsamp, chunk_size=2**22):
+    # Yields the intersections of all N(N-1)/2 pairs of lines as (M,2) arrays of
+    # [theta0, theta1]; parallel pairs are skipped
+    for keep, theta0, theta1 in intersection_blocks(XYsamp, chunk_size):
+        yield np.column_stack([theta0[keep], theta1[keep]])
+
+def intersection_density(XYsamp, bins, lim=1, chunk_size=2**22):
+    # Number of intersections falling in each cell of a bins x bins grid over
+    # [-lim,lim]^2, indexed [theta1 bin, theta0 bin]. Memory is bounded by the
+    # block size, so this scales to N(N-1)/2 far beyond what fits in RAM.
+    scale = bins/(2*lim)
+    counts = np.zeros(bins*bins, dtype=np.int64)
+    for keep, theta0, theta1 in intersection_blocks(XYsamp, chunk_size):
+        with np.errstate(invalid='ignore'):
+            i0 = (theta0+lim)*scale
+            i1 = (theta1+lim)*scale
+            keep &= (i0>=0) & (i0<bins) & (i1>=0) & (i1<bins)
+        counts += np.bincount(i1[keep].astype(np.int64)*bins + i0[keep].astype(np.int64), minlength=bins*bins)
+    return counts.reshape(bins,bins)
@@ -0,0 +1,149 @@
+import numpy as np
+from lsq import as_problem
+
+# First order optimizers for the lab2 least squares problem, all with the
+# trajectory contract of gd.gradient_descent: row 0 is the initial condition and
+# row k the iterate after k steps.
+#
+#   opt = HeavyBall(gamma=0.01, beta=0.5)
+#   traj = opt(XYsamp, K, Theta0)           # (K,2)
+#   trajs = opt.run(XYsamp, K, Theta0s)     # (G,K,2), all start points at once
+#
+# A subclass implements init, which returns its state for a batch of start
+# points, and step, which returns the next iterates. The gradient of
+# J = sum_n (theta0 + theta1*x_n - y_n)^2 is 2(A theta - b) with the A, b of
+# lsq.LeastSquares, so its Lipschitz constant is L = 2*lambda_max(A) and J is
+# mu = 2*lambda_min(A) strongly convex.
+
+def curvature(problem):
+    # (mu, L) as defined above
+    eigs = np.linalg.eigvalsh(problem.A)
+    return 2*eigs[0], 2*eigs[-1]
+
+class Optimizer:
+
+    def __call__(self, XYsamp, K, Theta0):
+        return self.run(XYsamp, K, np.reshape(Theta0,(1,-1)))[0]
+
+    def run(self, XYsamp, K, Theta0s):
+        problem = as_problem(XYsamp)
+        Theta = np.array(Theta0s, dtype=float)
+        traj = np.empty((Theta.shape[0],K,Theta.shape[1]))
+        state = self.init(problem, Theta)
+        for k in range(K):
+            traj[:,k] = Theta
+            if k<K-1:
+                Theta = self.step(problem, Theta, state, k)
+        return traj
+
+    def init(self, problem, Theta):
+        return {}
+
+    def step(self, problem, Theta, state, k):
+        raise NotImplementedError
+
+class GD(Optimizer):
+    # theta_{k+1} = theta_k - gamma grad(theta_k), same iterates as gd.gradient_descent
+
+    def __init__(self, gamma):
+        self.gamma = gamma
+
+    def step(self, problem, Theta, state, k):
+        return Theta - self.gamma*problem.grad(Theta)
+
+class HeavyBall(Optimizer):
+    # Polyak momentum: theta_{k+1} = theta_k - gamma grad(theta_k) + beta (theta_k - theta_{k-1}).
+    # Parameters left as None get Polyak's optimal values for a quadratic,
+    # gamma = 4/(sqrt(L)+sqrt(mu))^2 and beta = ((sqrt(L)-sqrt(mu))/(sqrt(L)+sqrt(mu)))^2.
+
+    def __init__(self, gamma=None, beta=None):
+        self.gamma = gamma
+        self.beta = beta
+
+    def init(self, problem, Theta):
+        mu, L = curvature(problem)
+        sL, smu = np.sqrt(L), np.sqrt(mu)
+        gamma = 4/(sL+smu)**2 if self.gamma is None else self.gamma
+        beta = ((sL-smu)/(sL+smu))**2 if self.beta is None else self.beta
+        return {'gamma':gamma, 'beta':beta, 'previous':Theta}
+
+    def step(self, problem, Theta, state, k):
+        new = Theta - state['gamma']*problem.grad(Theta) + state['beta']*(Theta-state['previous'])
+        state['previous'] = Theta
+        return new
+
+class Nesterov(Optimizer):
+    # Gradient step from the extrapolated point y_k = theta_k + beta (theta_k - theta_{k-1}).
+    # By default gamma = 1/L and beta = (sqrt(L)-sqrt(mu))/(sqrt(L)+sqrt(mu));
+    # beta='schedule' uses k/(k+3) instead, which does not need mu.
+
+    def __init__(self, gamma=None, beta=None):
+        self.gamma = gamma
+        self.beta = beta
+
+    def init(self, problem, Theta):
+        mu, L = curvature(problem)
+        gamma = 1/L if self.gamma is None else self.gamma
+        beta = (np.sqrt(L)-np.sqrt(mu))/(np.sqrt(L)+np.sqrt(mu)) if self.beta is None else self.beta
+        return {'gamma':gamma, 'beta':beta, 'previous':Theta}
+
+    def step(self, problem, Theta, state, k):
+        beta = k/(k+3) if state['beta']=='schedule' else state['beta']
+        Y = Theta + beta*(Theta-state['previous'])
+        state['previous'] = Theta
+        return Y - state['gamma']*problem.grad(Y)
+
+class Adam(Optimizer):
+    # Adam with bias correction, on the full gradient
+
+    def __init__(self, gamma=0.01, beta1=0.9, beta2=0.999, eps=1e-8):
+        self.gamma = gamma
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+
+    def init(self, problem, Theta):
+        return {'m':np.zeros_like(Theta), 'v':np.zeros_like(Theta)}
+
+    def step(self, problem, Theta, state, k):
+        g = problem.grad(Theta)
+        state['m'] = self.beta1*state['m'] + (1-self.beta1)*g
+        state['v'] = self.beta2*state['v'] + (1-self.beta2)*g**2
+        m = state['m']/(1-self.beta1**(k+1))
+        v = state['v']/(1-self.beta2**(k+1))
+        return Theta - self.gamma*m/(np.sqrt(v)+self.eps)
+
+class ConjugateGradient(Optimizer):
+    # Linear conjugate gradient on the normal equations A theta = b, with the
+    # exact line search of the quadratic. Reaches the minimizer in d = 2 steps
+    # up to rounding; after that the residual is zero and the iterate stays put.
+
+    def init(self, problem, Theta):
+        r = -problem.grad(Theta)/2          # b - A theta
+        return {'r':r, 'p':r.copy()}
+
+    def step(self, problem, Theta, state, k):
+        r, p = state['r'], state['p']
+        Ap = p@problem.A
+        rr = np.einsum('ij,ij->i', r, r)
+        pAp = np.einsum('ij,ij->i', p, Ap)
+        alpha = np.divide(rr, pAp, out=np.zeros_like(rr), where=pAp>0)
+        Theta = Theta + alpha[:,None]*p
+        r = r - alpha[:,None]*Ap
+        beta = np.divide(np.einsum('ij,ij->i', r, r), rr, out=np.zeros_like(rr), where=rr>0)
+        state['r'], state['p'] = r, r + beta[:,None]*p
+        return Theta
+
+optimizers = {
+    'gd': GD,
+    'heavyball': HeavyBall,
+    'nesterov': Nesterov,
+    'adam': Adam,
+    'cg': ConjugateGradient,
+}
+
+def iterations_to_tolerance(traj, theta_star, tol=1e-6):
+    # First k with |theta_k - theta*| <= tol (1 + |theta*|), per trajectory; -1 if never
+    err = np.linalg.norm(traj-theta_star, axis=-1)
+    hit = err<=tol*(1+np.linalg.norm(theta_star))
+    return np.where(hit.any(axis=-1), hit.argmax(axis=-1), -1)
@@ -0,0 +1,122 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+from lsq import gradient_field, line_intersections, intersection_density
+from gd import make_grid
+
+# Figures for lab2. They take the data and true parameters as arguments
+# instead of reading the notebook globals.
+
+def decimate(values, max_points=None):
+    # Min/max decimation of R curves, values (R,K) or (R,K,c) for c coordinates.
+    # The K points are split into buckets and each bucket keeps its first and
+    # last point and, for every coordinate, its minimum and maximum, so that
+    # zig-zags and spikes survive. Returns (R,M) indices in increasing order,
+    # at most max_points per curve (all K if max_points is None or >= K).
+    values = np.asarray(values, dtype=float)
+    values = values.reshape(values.shape[:2]+(-1,))
+    R, K, c = values.shape
+    if max_points is None or K<=max_points:
+        return np.broadcast_to(np.arange(K), (R,K))
+    buckets = max(1, max_points//(2+2*c))
+    size = -(-K//buckets)
+    padded = np.full((R, buckets*size, c), np.nan)
+    padded[:,:K] = values
+    padded = padded.reshape(R, buckets, size, c)
+    # Missing (padding) and non-finite values never win the min or max
+    finite = np.isfinite(padded)
+    lo = np.where(finite, padded, np.inf).argmin(axis=2)             # (R,buckets,c)
+    hi = np.where(finite, padded, -np.inf).argmax(axis=2)
+    first = np.zeros((R,buckets,1), dtype=int)
+    last = np.full((R,buckets,1), size-1)
+    picks = np.concatenate([first, lo, hi, last], axis=2) + size*np.arange(buckets)[:,None]
+    picks = np.minimum(picks, K-1).reshape(R,-1)
+    return np.sort(picks, axis=1)
+
+def plot_error(trajectories, theta0, theta1, max_points=None):
+    # Error |theta_k - theta| of every trajectory against the iteration index, on a
+    # log scale. trajectories has shape (...,K,2); all of them go into one LineCollection.
+    traj = np.reshape(trajectories, (-1,)+np.shape(trajectories)[-2:])
+    with np.errstate(over='ignore', invalid='ignore'):
+        err = np.linalg.norm(traj - [theta0,theta1], axis=-1)
+    err[~np.isfinite(err)] = np.nan
+    # On the log axis the extremes that matter are those of log(err)
+    with np.errstate(divide='ignore'):
+        k = decimate(np.log(err), max_points)
+    err = np.take_along_axis(err, k, axis=1)
+
+    fig = plt.figure()
+    ax = plt.gca()
+    ax.add_collection(LineCollection(np.stack([k, err], axis=-1), linewidths=1))
+    ax.set_yscale('log')
+    ax.autoscale_view()
+    plt.xlabel('iteration',fontsize=15)
+    plt.ylabel('error',fontsize=15)
+    return fig
+
+def plot_traj(fig, trajectories, max_points=None):
+    # Overlays every (K,2) trajectory in trajectories (shape (...,K,2)) as a thin red line
+    plt.figure(fig)
+    traj = np.reshape(trajectories, (-1,)+np.shape(trajectories)[-2:])
+    traj = np.take_along_axis(traj, decimate(traj, max_points)[...,None], axis=1)
+    plt.gca().add_collection(LineCollection(traj, colors='r', linewidths=0.5))
+    return fig
+
+def plot_quiver(XYsamp, theta0, theta1, gridN=10, max_arrows=None, scale=30):
+    # The negative gradient field on a gridN x gridN grid over [-1,1]^2. The field is
+    # computed at full resolution; max_arrows thins the display to at most that many
+    # arrows per axis.
+    theta0_grid, theta1_grid = make_grid(gridN)
+    U, V = gradient_field(XYsamp, theta0_grid, theta1_grid)
+    step = 1 if max_arrows is None else max(1, -(-gridN//max_arrows))
+    view = (slice(None,None,step), slice(None,None,step))
+
+    fig = plt.figure(figsize=(8,8))
+    plt.quiver(theta0_grid[view], theta1_grid[view], -U[view], -V[view], scale=scale)
+
+    plt.xlabel('theta0',fontsize=15)
+    plt.ylabel('theta1',fontsize=15)
+    plt.plot(theta0,theta1,'o',markersize=16)
+    plt.axis([-1,1,-1,1])
+    return fig
+
+def sample_lines(XYsamp, lim=1):
+    # Segments of the lines theta0 + x_n*theta1 = y_n across the box [-lim,lim]^2
+    X = np.asarray(XYsamp[:,0], dtype=float)
+    Y = np.asarray(XYsamp[:,1], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # theta1 as a function of theta0; lines with x_n = 0 are vertical
+        t0 = np.stack([np.full_like(X,-lim), np.full_like(X,lim)], axis=1)
+        t1 = (Y[:,None]-t0)/X[:,None]
+    vertical = X==0
+    t0[vertical] = Y[vertical,None]
+    t1[vertical] = [-lim,lim]
+    return np.stack([t0,t1], axis=2)
+
+def plot_additive_cost(XYsamp, theta0, theta1, traj=None, max_dots=10**6, bins=800):
+    # Section 4 figure: the N lines l_n = 0 as one LineCollection, their pairwise
+    # intersections, the true parameters and optionally a trajectory.
+    # Up to max_dots intersections are drawn as a single scatter; beyond that
+    # they are binned on the fly into a bins x bins density image, so memory
+    # stays bounded however many pairs there are.
+    N = len(XYsamp)
+    fig = plt.figure(figsize=(8,8))
+    ax = plt.gca()
+    ax.add_collection(LineCollection(sample_lines(XYsamp), colors='k', linewidths=0.5))
+
+    if N*(N-1)//2<=max_dots:
+        dots = np.concatenate(list(line_intersections(XYsamp)) or [np.empty((0,2))])
+        plt.scatter(dots[:,0], dots[:,1], s=4, c='b', zorder=2)
+    else:
+        counts = intersection_density(XYsamp, bins).astype(float)
+        counts[counts==0] = np.nan
+        plt.imshow(np.log10(counts), origin='lower', extent=[-1,1,-1,1], cmap='Blues', zorder=2)
+
+    plt.plot(theta0,theta1,'o',color='orange',markersize=16,zorder=3)
+    if traj is not None:
+        plt.plot(traj[:,0],traj[:,1],'r',linewidth=1,zorder=4)
+    plt.xlabel('theta0',fontsize=15)
+    plt.ylabel('theta1',fontsize=15)
+    plt.axis([-1,1,-1,1])
+    return fig
@@ -0,0 +1,92 @@
+import numpy as np
+from lsq import design_matrix
+
+# Recursive least squares: the estimate theta and P = (Phi^T W Phi)^-1 are kept
+# up to date as samples arrive, at O(d^2) per sample instead of refitting on the
+# whole history. W weights a sample that is `age` samples old by
+# forgetting^age; forgetting=1 weighs all samples equally and then, up to the
+# prior below, theta is the solve_lr estimate of all the samples seen so far.
+#
+# Without from_design, the estimator starts from theta = 0 and P = delta*I,
+# a ridge prior of weight 1/delta that fades with forgetting < 1 but stays
+# (tiny) otherwise.
+
+class RecursiveLeastSquares:
+
+    def __init__(self, d, forgetting=1.0, delta=1e8):
+        self.theta = np.zeros(d)
+        self.P = delta*np.eye(d)
+        self.forgetting = float(forgetting)
+        self.n = 0
+
+    @classmethod
+    def from_design(cls, Phi, Y, forgetting=1.0):
+        # Exact start from a first batch with Phi of full column rank
+        Phi = np.asarray(Phi, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        rls = cls(Phi.shape[1], forgetting)
+        w = forgetting**np.arange(len(Y)-1,-1,-1.0)
+        rls.P = np.linalg.inv(Phi.T@(w[:,None]*Phi))
+        rls.theta = rls.P@(Phi.T@(w*Y))
+        rls.n = len(Y)
+        return rls
+
+    @property
+    def d(self):
+        return len(self.theta)
+
+    def update(self, phi, y):
+        # One sample: phi is a row of the design matrix, e.g. [1, x]
+        phi = np.asarray(phi, dtype=float)
+        Pphi = self.P@phi
+        k = Pphi/(self.forgetting + phi@Pphi)
+        self.theta = self.theta + k*(y - phi@self.theta)
+        P = (self.P - np.outer(k, Pphi))/self.forgetting
+        self.P = (P+P.T)/2
+        self.n += 1
+        return self.theta
+
+    def update_batch(self, Phi, Y):
+        # m samples at once; matches m calls to update. Batches smaller than d
+        # go through update, larger ones through the d x d information form
+        #   P' = (forgetting^m P^-1 + Phi^T W Phi)^-1
+        #   theta' = theta + P' Phi^T W (Y - Phi theta)
+        # with W = diag(forgetting^(m-1-i)), so the newest sample has weight 1.
+        # The cost is O(d^2) per sample plus at most O(d^3) per batch.
+        Phi = np.asarray(Phi, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        m = len(Y)
+        if m<self.d:
+            for phi, y in zip(Phi, Y):
+                self.update(phi, y)
+            return self.theta
+        w = self.forgetting**np.arange(m-1,-1,-1.0)
+        PhiTW = Phi.T*w
+        H = self.forgetting**m*np.linalg.inv(self.P) + PhiTW@Phi
+        P = np.linalg.inv(H)
+        self.theta = self.theta + P@(PhiTW@(Y - Phi@self.theta))
+        self.P = (P+P.T)/2
+        self.n += m
+        return self.theta
+
+    def update_samples(self, XYsamp, degree=1):
+        # Mini-batch of (x, y) samples through lsq.design_matrix
+        return self.update_batch(*design_matrix(XYsamp, degree))
+
+    def predict(self, Phi):
+        return np.asarray(Phi, dtype=float)@self.theta
+
+    def snapshot(self):
+        # Copy of the state; restore it with restore or from_snapshot
+        return {'theta':self.theta.copy(), 'P':self.P.copy(), 'forgetting':self.forgetting, 'n':self.n}
+
+    def restore(self, state):
+        self.theta = np.array(state['theta'], dtype=float)
+        self.P = np.array(state['P'], dtype=float)
+        self.forgetting = float(state['forgetting'])
+        self.n = int(state['n'])
+        return self
+
+    @classmethod
+    def from_snapshot(cls, state):
+        return cls(len(state['theta'])).restore(state)
@@ -0,0 +1,110 @@
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+# Stochastic gradient descent for the lab2 least squares problem.
+# Each epoch draws one permutation of the samples and sweeps it in consecutive
+# mini-batches, so samples are drawn without replacement. A step follows the
+# gradient of the per-sample loss (theta0 + theta1*x - y)^2 averaged over the
+# batch, which makes batch_size=1 the SGD of part 5a.
+# The trajectory has the initial condition in row 0 and one row per update after it.
+
+def SGD(XYsamp,gamma,epochs,batch_size=1,rng=None,output=None):
+    # rng: a np.random.Generator or a seed
+    # output: a gd.OutputPolicy; with a seed for rng, dropped iterates can be
+    # recomputed with sgd_iterate
+    rng = np.random.default_rng(rng)
+    X = np.asarray(XYsamp[:,0], dtype=float)
+    Y = np.asarray(XYsamp[:,1], dtype=float)
+    N = len(X)
+    batch_size = min(batch_size, N)
+    nbatches = -(-N//batch_size)
+    K = 1+epochs*nbatches
+    kept = output.kept(K) if output else np.arange(K)
+
+    theta = rng.uniform(-1,1,2)
+    traj = output.allocate((len(kept),2)) if output else np.empty((K,2))
+    if kept[0]==0:
+        traj[0] = theta
+    for epoch in range(epochs):
+        block = sgd_steps(X, Y, gamma, theta, batch_size, rng.permutation(N))
+        theta = block[-1]
+        # block row j is iterate 1+epoch*nbatches+j
+        first = 1+epoch*nbatches
+        lo, hi = np.searchsorted(kept, [first, first+nbatches])
+        traj[lo:hi] = block[kept[lo:hi]-first]
+    return traj
+
+def sgd_steps(X, Y, gamma, theta, batch_size, perm):
+    # Sweeps the samples in the order perm, batch_size at a time
+    if batch_size==1:
+        return sgd_epoch_single(X[perm], Y[perm], gamma, theta)
+    return sgd_epoch_batched(X[perm], Y[perm], gamma, theta, batch_size)
+
+def sgd_iterate(XYsamp,gamma,stored,every,k,batch_size=1,rng=None):
+    # Iterate k of SGD(XYsamp,gamma,epochs,batch_size,rng,OutputPolicy(every=every))
+    # from its stored checkpoints. rng must be the seed of the original run:
+    # the random stream is regenerated to get the permutations of the epochs
+    # between the nearest checkpoint and k.
+    rng = np.random.default_rng(rng)
+    X = np.asarray(XYsamp[:,0], dtype=float)
+    Y = np.asarray(XYsamp[:,1], dtype=float)
+    N = len(X)
+    batch_size = min(batch_size, N)
+    nbatches = -(-N//batch_size)
+
+    c = (k//every)*every
+    theta = np.array(stored[k//every], dtype=float)
+    rng.uniform(-1,1,2)
+    for epoch in range((k-1)//nbatches+1 if k else 0):
+        perm = rng.permutation(N)
+        first = 1+epoch*nbatches        # iterate reached by the first batch of the epoch
+        skip = max(c+1-first, 0)
+        todo = min(k-first+1, nbatches) - skip
+        if todo<=0:
+            continue
+        block = sgd_steps(X, Y, gamma, theta, batch_size, perm[skip*batch_size:(skip+todo)*batch_size])
+        theta = block[-1]
+    return theta
+
+def sgd_epoch_single(X, Y, gamma, theta):
+    # The updates are sequential, so this runs on Python floats, which is
+    # several times faster than indexing numpy arrays one element at a time
+    t0, t1 = float(theta[0]), float(theta[1])
+    T0, T1 = [], []
+    for x, y in zip(X.tolist(), Y.tolist()):
+        step = 2*gamma*(t0 + t1*x - y)
+        t0 -= step
+        t1 -= step*x
+        T0.append(t0)
+        T1.append(t1)
+    return np.column_stack([T0,T1])
+
+def sgd_epoch_batched(X, Y, gamma, theta, batch_size):
+    nbatches = -(-len(X)//batch_size)
+    traj = np.empty((nbatches,2))
+    t0, t1 = theta
+    for j in range(nbatches):
+        x = X[j*batch_size:(j+1)*batch_size]
+        r = t0 + t1*x - Y[j*batch_size:(j+1)*batch_size]
+        t0 = t0 - 2*gamma*r.mean()
+        t1 = t1 - 2*gamma*(r@x)/len(x)
+        traj[j] = t0, t1
+    return traj
+
+def sgd_replica(XYsamp, gamma, epochs, batch_size, seed):
+    return SGD(XYsamp, gamma, epochs, batch_size, np.random.default_rng(seed))
+
+def SGD_replicas(XYsamp,gamma,epochs,replicas,seed=None,batch_size=1,workers=1):
+    # Runs `replicas` independent SGD runs and stacks their trajectories into
+    # a (replicas, 1+epochs*nbatches, 2) array. Replica r draws from the r-th
+    # stream spawned from SeedSequence(seed), so for a given seed the result is
+    # the same whatever the number of workers.
+    seeds = np.random.SeedSequence(seed).spawn(replicas)
+    run = partial(sgd_replica, XYsamp, gamma, epochs, batch_size)
+    if workers>1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            trajs = list(pool.map(run, seeds, chunksize=max(1,replicas//(4*workers))))
+    else:
+        trajs = [run(s) for s in seeds]
+    return np.stack(trajs)
@@ -1,32 +1,473 @@
 import sys
 import os
-import jupytext
+import time
+import re
+import json
+import hashlib
+import signal
+import argparse
+from importlib import metadata
+from concurrent.futures import ProcessPoolExecutor
 
 this_folder = os.path.dirname(os.path.realpath(__file__))
 
+manifest_file = os.path.join(this_folder, '.nb2py_manifest.json')
+
 sourcedests = [
-    'lab1/python_tutorial/01_jupyter.py',   
-    'lab1/python_tutorial/02_datatypes_scalars.py',   
-    'lab1/python_tutorial/03_datatypes_iterables.py',   
-    'lab1/python_tutorial/04_controlflow.py',   
-    'lab1/python_tutorial/05_codeorg.py',   
-    'lab1/python_tutorial/06_comprehensions.py',    
-    'lab1/python_tutorial/07_stndlib.py',   
-    'lab1/python_tutorial/08_numpy.py',    
+    'lab1/python_tutorial/01_jupyter.py',
+    'lab1/python_tutorial/02_datatypes_scalars.py',
+    'lab1/python_tutorial/03_datatypes_iterables.py',
+    'lab1/python_tutorial/04_controlflow.py',
+    'lab1/python_tutorial/05_codeorg.py',
+    'lab1/python_tutorial/06_comprehensions.py',
+    'lab1/python_tutorial/07_stndlib.py',
+    'lab1/python_tutorial/08_numpy.py',
     'lab1/python_tutorial/09_matplotlib.py'
 ]
 
-for source in sourcedests:
+def dest_for(source):
     source_folder, source_file = os.path.split(source)
     source_filename, source_ext = os.path.splitext(source_file)
-    dest_file = os.path.join(this_folder,source_folder, source_filename+'.ipynb')
+    return os.path.join(source_folder, source_filename+'.ipynb')
+
+# Fast path ##################################################################
+# All the tutorials share the same jupytext header and only use bare `# %%` and
+# `# %% [markdown]` markers, so they can be turned into notebook JSON directly,
+# without importing jupytext. Anything else raises NotPercent and is handed to jupytext.
+
+code_marker = '# %%'
+cell_marker_re = re.compile(r'^\s*#\s*%%')
+markdown_markers = ('# %% [markdown]', '# %% [md]')
+
+class NotPercent(Exception):
+    pass
+
+def yaml_value(value):
+    value = value.strip()
+    if len(value)>1 and value[0]==value[-1] and value[0] in '\'"':
+        value = value[1:-1]
+    return value
+
+def parse_header(lines):
+    # Returns the kernelspec and the index of the first line after the header
+    if not lines or lines[0].rstrip()!='# ---':
+        raise NotPercent('no jupytext header')
+    for end in range(1,len(lines)):
+        if lines[end].rstrip()=='# ---':
+            break
+    else:
+        raise NotPercent('unterminated header')
+
+    section = None
+    kernelspec = {}
+    is_percent = False
+    for line in lines[1:end]:
+        if not line.startswith('#'):
+            raise NotPercent('header line is not a comment')
+        text = line[2:].rstrip() if line.startswith('# ') else line[1:].rstrip()
+        indent = len(text)-len(text.lstrip())
+        if indent==0:
+            if text!='jupyter:':
+                raise NotPercent('unknown header key '+text)
+        elif indent==2:
+            section = text.strip()
+            if section not in ('jupytext:','kernelspec:'):
+                raise NotPercent('unknown header key '+section)
+        elif section=='kernelspec:' and indent==4:
+            key, _, value = text.strip().partition(':')
+            kernelspec[key] = yaml_value(value)
+        elif section=='jupytext:' and indent==4:
+            # Other jupytext options (metadata filters...) change the output
+            if text.strip()!='text_representation:':
+                raise NotPercent('unsupported jupytext option '+text.strip())
+        elif section=='jupytext:' and indent==6:
+            key, _, value = text.strip().partition(':')
+            if key=='format_name':
+                is_percent = yaml_value(value)=='percent'
+        else:
+            raise NotPercent('unexpected header line '+text)
 
-    if os.path.exists(dest_file):
-        print('Overwrite', os.path.join(source_folder, source_filename+'.ipynb'), '?')
-        answer = input('[y/n] ')
+    if not is_percent:
+        raise NotPercent('not a percent-format script')
+    return kernelspec, end+1
+
+def split_source(lines):
+    return '\n'.join(lines).splitlines(True)
+
+def uncomment(line):
+    if line.startswith('# '):
+        return line[2:]
+    if line.startswith('#') or not line.strip():
+        return line[1:]
+    raise NotPercent('uncommented line in a markdown cell')
+
+# jupytext only records lines_to_next_cell when it differs from the PEP8 spacing
+# below (two blank lines around top-level def/class, one otherwise). This mirrors
+# jupytext.pep8 for code without multi-line strings.
+
+def is_def(line):
+    return line.startswith(('def ','async ','class '))
+
+def starts_with_def(lines):
+    for i, line in enumerate(lines):
+        if not line.strip():
+            if i>0 and not lines[i-1].strip():
+                return False
+            continue
+        if is_def(line):
+            return True
+        if not line.startswith(('#','@',' ',')')):
+            return False
+    return False
 
-        if answer!='y':
+def ends_with_def(lines):
+    lines = lines[::-1]
+    for i, line in enumerate(lines):
+        if not line.strip():
+            if i>0 and not lines[i-1].strip():
+                return False
             continue
+        if is_def(line):
+            return True
+        if not line.startswith(('#',' ',')')):
+            return False
+    return False
+
+def has_code(lines):
+    for i, line in enumerate(lines):
+        if line.strip().startswith('#'):
+            continue
+        if not line.strip():
+            if i>0 and not lines[i-1].strip():
+                return False
+            continue
+        return True
+    return False
+
+def pep8_blank_lines(prev_lines, next_lines):
+    if not next_lines:
+        return 1
+    if not prev_lines:
+        return 0
+    if ends_with_def(prev_lines):
+        return 2 if has_code(next_lines) else 1
+    if prev_lines[-1].strip() and not prev_lines[-1].startswith('#') and starts_with_def(next_lines):
+        return 2
+    return 1
+
+def percent_to_notebook(text):
+    lines = text.splitlines()
+    notebook_metadata = {}
+    if lines and lines[0].startswith('#') and 'coding' in lines[0]:
+        notebook_metadata['jupytext'] = {'encoding':lines[0]}
+        lines = lines[1:]
+    kernelspec, start = parse_header(lines)
+    if kernelspec:
+        notebook_metadata['kernelspec'] = kernelspec
+
+    # The header is followed by one blank line and the first cell marker
+    if lines[start:start+1]!=[''] or start+1>=len(lines):
+        raise NotPercent('unexpected spacing after the header')
+    starts = []
+    in_markdown = in_fence = False
+    for i in range(start+1,len(lines)):
+        marker = lines[i].rstrip()
+        if cell_marker_re.match(lines[i]):
+            # jupytext does not split cells inside a fenced block of a markdown cell
+            if in_fence:
+                raise NotPercent('cell marker inside a fenced block')
+            if marker!=code_marker and marker not in markdown_markers:
+                raise NotPercent('cell marker with options: '+marker)
+            starts.append(i)
+            in_markdown = marker!=code_marker
+        elif in_markdown and lines[i].lstrip('# ').startswith(('```','~~~')):
+            in_fence = not in_fence
+    if not starts or starts[0]!=start+1:
+        raise NotPercent('code before the first cell marker')
+    starts.append(len(lines))
+
+    cells = []
+    for index in range(len(starts)-1):
+        first, end = starts[index], starts[index+1]
+        is_markdown = lines[first].rstrip()!=code_marker
+
+        # Same rule as jupytext: a cell is followed by one or two separating blank lines
+        if end-first>=3 and lines[end-3].strip() and not lines[end-2].strip() and not lines[end-1].strip():
+            content_end = end-2
+        elif end-first>=2 and lines[end-1]=='':
+            content_end = end-1
+        else:
+            content_end = end
+        body = lines[first+1:content_end]
+        blank_lines = end-content_end if content_end<len(lines) else 1
+        if end==len(lines) and content_end<len(lines):
+            blank_lines += 1
+
+        cell_metadata = {}
+        if blank_lines!=pep8_blank_lines(body or [''], lines[end:]):
+            cell_metadata['lines_to_next_cell'] = blank_lines
+
+        if is_markdown:
+            body = [uncomment(line) for line in body]
+        else:
+            for line in body:
+                if line.startswith('#') and line[1:].lstrip()[:1] in ('%','!','?'):
+                    raise NotPercent('commented magic in a code cell')
+                if '"""' in line or "'''" in line:
+                    raise NotPercent('multi-line string in a code cell')
+
+        source = split_source(body)
+        cell_id = hashlib.sha1('{}:{}'.format(index,'\n'.join(body)).encode()).hexdigest()[:8]
+        if is_markdown:
+            cells.append({'cell_type':'markdown', 'id':cell_id, 'metadata':cell_metadata, 'source':source})
+        else:
+            cells.append({'cell_type':'code', 'execution_count':None, 'id':cell_id,
+                          'metadata':cell_metadata, 'outputs':[], 'source':source})
+
+    return {'cells':cells, 'metadata':notebook_metadata, 'nbformat':4, 'nbformat_minor':5}
+
+def convert_fast(source_path, dest_path):
+    with open(source_path, encoding='utf-8') as file:
+        ntbk = percent_to_notebook(file.read())
+    with open(dest_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(ntbk, indent=1, sort_keys=True, ensure_ascii=False)+'\n')
+
+def convert_jupytext(source_path, dest_path):
+    import jupytext
+    ntbk = jupytext.read(source_path)
+    jupytext.write(ntbk, dest_path, fmt='notebook')
+
+###############################################################################
+
+def jupytext_version():
+    try:
+        return metadata.version('jupytext')
+    except metadata.PackageNotFoundError:
+        return None
+
+def convert(source, dest, engine='auto'):
+    # Runs in a worker process when --jobs > 1, so it only touches its own files.
+    # Returns the engine that was actually used.
+    tic = time.perf_counter()
+    source_path = os.path.join(this_folder,source)
+    dest_path = os.path.join(this_folder,dest)
+    used = 'jupytext'
+    if engine=='auto':
+        try:
+            convert_fast(source_path, dest_path)
+            used = 'fast'
+        except NotPercent:
+            pass
+    if used=='jupytext':
+        convert_jupytext(source_path, dest_path)
+    return source, time.perf_counter()-tic, used
+
+def load_manifest():
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as file:
+        return json.load(file)
+
+def save_manifest(manifest):
+    tmp_file = manifest_file+'.tmp'
+    with open(tmp_file,'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path,'rb') as file:
+        for block in iter(lambda: file.read(1<<20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def source_state(source, entry, engine='auto'):
+    # Reuse the recorded hash when size and mtime are unchanged, so a no-op run only stats the files
+    st = os.stat(os.path.join(this_folder,source))
+    if entry and entry['size']==st.st_size and entry['mtime_ns']==st.st_mtime_ns:
+        digest = entry['hash']
+    else:
+        digest = file_hash(os.path.join(this_folder,source))
+    return {'hash':digest, 'size':st.st_size, 'mtime_ns':st.st_mtime_ns,
+            'jupytext':jupytext_version(), 'engine':engine, 'dest':dest_for(source)}
+
+def is_current(entry, state):
+    return (entry is not None
+            and entry['hash']==state['hash']
+            and entry['jupytext']==state['jupytext']
+            and entry.get('engine','jupytext')==state['engine']
+            and entry['dest']==state['dest']
+            and os.path.exists(os.path.join(this_folder,state['dest'])))
+
+def stale_entries(manifest):
+    # Outputs whose source script no longer exists
+    return [source for source in manifest if not os.path.exists(os.path.join(this_folder,source))]
+
+def select(sources, policy):
+    # policy is one of 'ask', 'force', 'skip'
+    todo = []
+    for source in sources:
+        dest = dest_for(source)
+        if os.path.exists(os.path.join(this_folder,dest)):
+            if policy=='skip':
+                print('Skipping', dest)
+                continue
+            if policy=='ask':
+                print('Overwrite', dest, '?')
+                answer = input('[y/n] ')
+                if answer!='y':
+                    continue
+        todo.append((source,dest))
+    return todo
+
+def run(todo, jobs=1, pool=None, engine='auto'):
+    # pool: an executor to reuse across calls (watch mode); otherwise one is created when jobs > 1.
+    # Returns the (source, elapsed, engine) of the conversions that succeeded and the
+    # (source, error) of those that failed; a failure does not stop the others.
+    tic = time.perf_counter()
+    results = []
+    failures = []
+    if pool is None and jobs>1 and len(todo)>1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return run(todo, jobs, pool, engine)
+    if pool is not None:
+        futures = [(source, pool.submit(convert, source, dest, engine)) for source, dest in todo]
+        for source, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as error:
+                failures.append((source, error))
+    else:
+        for source, dest in todo:
+            try:
+                results.append(convert(source, dest, engine))
+            except Exception as error:
+                failures.append((source, error))
+    total = time.perf_counter()-tic
+
+    for source, elapsed, used in results:
+        print('{:8.3f}s  {:8s}  {}'.format(elapsed,used,source))
+    for source, error in failures:
+        print('Error converting {}: {}: {}'.format(source, type(error).__name__, error))
+    if results:
+        print('Converted {} files in {:.3f}s ({:.1f} files/s)'.format(len(results),total,len(results)/total))
+    return results, failures
+
+def mtime(source):
+    try:
+        return os.stat(os.path.join(this_folder,source)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def ignore_sigint():
+    # Ctrl-C is handled by the watcher, which shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def watch(sources, manifest, jobs=1, interval=0.5, debounce=0.3, engine='auto'):
+    # Poll mtimes; a file is reconverted once it has not changed for `debounce` seconds.
+    # Between polls the process sleeps, so an idle watcher costs one stat per file per interval.
+    mtimes = {source: mtime(source) for source in sources}
+    pending = {}
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=ignore_sigint) if jobs>1 else None
+    print('Watching', len(sources), 'files (Ctrl-C to stop)')
+    try:
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            for source in sources:
+                m = mtime(source)
+                if m!=mtimes[source]:
+                    mtimes[source] = m
+                    if m is not None:
+                        pending[source] = now
+            ready = [source for source, seen in pending.items() if now-seen>=debounce]
+            if not ready:
+                continue
+            for source in ready:
+                del pending[source]
+
+            # Saves that leave the content unchanged do not trigger a conversion.
+            # A file deleted since its change was seen (editors that save by
+            # delete and rewrite) is picked up again when it reappears.
+            states = {}
+            for source in ready:
+                try:
+                    states[source] = source_state(source, manifest.get(source), engine)
+                except FileNotFoundError:
+                    mtimes[source] = None
+                except OSError as error:
+                    print('Error reading {}: {}'.format(source, error))
+            todo = [(source,states[source]['dest']) for source in states
+                    if not is_current(manifest.get(source), states[source])]
+            # All ready files go to the pool together; run reports a failing file
+            # on its own and the others still convert
+            for source, elapsed, used in run(todo, jobs, pool, engine)[0]:
+                manifest[source] = states[source]
+            save_manifest(manifest)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert percent-format .py scripts into .ipynb notebooks.')
+    parser.add_argument('sources', nargs='*', default=sourcedests,
+                        help='scripts to convert, relative to the repository root (default: the lab1 tutorials)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes')
+    policy = parser.add_mutually_exclusive_group()
+    policy.add_argument('--force', dest='policy', action='store_const', const='force',
+                        help='overwrite existing notebooks without asking')
+    policy.add_argument('--skip-existing', dest='policy', action='store_const', const='skip',
+                        help='leave existing notebooks untouched')
+    parser.set_defaults(policy='ask')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='reconvert even if the manifest says the notebook is up to date')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete notebooks whose source script no longer exists')
+    parser.add_argument('--engine', choices=['auto','jupytext'], default='auto',
+                        help='auto uses the built-in percent parser and falls back to jupytext for other formats')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and reconvert scripts as they are saved')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between polls in watch mode')
+    parser.add_argument('--debounce', type=float, default=0.3,
+                        help='seconds a file must stay unchanged before it is reconverted in watch mode')
+    args = parser.parse_args(argv)
+
+    manifest = load_manifest()
+    states = {source: source_state(source, manifest.get(source), args.engine) for source in args.sources}
+    if args.no_cache:
+        changed = list(args.sources)
+    else:
+        changed = [source for source in args.sources if not is_current(manifest.get(source), states[source])]
+    if len(changed)<len(args.sources):
+        print('Up to date:', len(args.sources)-len(changed), 'files')
+    for source in set(args.sources)-set(changed):
+        manifest[source] = states[source]
+
+    todo = select(changed, args.policy)
+    results, failures = run(todo, max(args.jobs,1), engine=args.engine)
+    for source, elapsed, used in results:
+        manifest[source] = states[source]
+
+    for source in stale_entries(manifest):
+        dest = os.path.join(this_folder,manifest[source]['dest'])
+        if args.prune:
+            print('Removing stale', manifest[source]['dest'])
+            if os.path.exists(dest):
+                os.remove(dest)
+            del manifest[source]
+        else:
+            print('Stale (source missing):', manifest[source]['dest'])
+
+    save_manifest(manifest)
+
+    if args.watch:
+        watch(args.sources, manifest, max(args.jobs,1), args.interval, args.debounce, args.engine)
+    elif failures:
+        sys.exit(1)
 
-    ntbk = jupytext.read(os.path.join(this_folder,source))
-    jupytext.write(ntbk, dest_file, fmt='notebook')
+if __name__=='__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,246 @@
+import sys
+import os
+import io
+import ast
+import json
+import time
+import types
+import hashlib
+import argparse
+import traceback
+import contextlib
+
+try:
+    import dill as pickle     # can also snapshot functions and classes defined in the notebook
+except ImportError:
+    import pickle
+
+import nb2py
+
+this_folder = os.path.dirname(os.path.realpath(__file__))
+
+cache_folder = os.path.join(this_folder, '.nbexec_cache')
+
+snapshot_format = 'v2'    # part of every cell key, so entries in an older format are not reused
+
+# Reading cells ###############################################################
+
+def read_cells(path):
+    # Returns the notebook (as nbformat JSON) and the indices of its code cells
+    if path.endswith('.ipynb'):
+        with open(path, encoding='utf-8') as file:
+            ntbk = json.load(file)
+    else:
+        with open(path, encoding='utf-8') as file:
+            text = file.read()
+        try:
+            ntbk = nb2py.percent_to_notebook(text)
+        except nb2py.NotPercent:
+            import jupytext
+            ntbk = json.loads(jupytext.writes(jupytext.reads(text, fmt='py:percent'), fmt='ipynb'))
+    code_cells = [i for i, cell in enumerate(ntbk['cells']) if cell['cell_type']=='code']
+    return ntbk, code_cells
+
+def cell_source(cell):
+    source = cell['source']
+    return source if isinstance(source,str) else ''.join(source)
+
+def strip_magics(source):
+    # There is no IPython kernel here: magics and shell escapes become no-ops
+    lines = []
+    for line in source.splitlines():
+        stripped = line.lstrip()
+        if stripped.startswith(('%','!')):
+            line = line[:len(line)-len(stripped)]+'pass  # '+stripped
+        lines.append(line)
+    return '\n'.join(lines)
+
+def cell_keys(path, sources):
+    # Each key covers the cell and everything above it, so editing a cell
+    # invalidates it and the whole suffix below
+    key = hashlib.sha256((snapshot_format+os.path.dirname(os.path.abspath(path))).encode()).hexdigest()
+    keys = []
+    for source in sources:
+        key = hashlib.sha256((key+'\0'+source).encode()).hexdigest()
+        keys.append(key)
+    return keys
+
+# Cache #######################################################################
+# One file per cell key holding the cell's output and, when every variable
+# could be pickled, a snapshot of the namespace after the cell ran.
+
+def entry_path(key):
+    return os.path.join(cache_folder, key+'.pickle')
+
+def load_entry(key):
+    path = entry_path(key)
+    try:
+        with open(path,'rb') as file:
+            entry = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(path)    # mark as recently used
+    return entry
+
+def save_entry(key, entry):
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = entry_path(key)+'.tmp'
+    with open(tmp_path,'wb') as file:
+        pickle.dump(entry, file)
+    os.replace(tmp_path, entry_path(key))
+
+def evict(max_bytes):
+    # Least recently used first, using the mtime refreshed by load_entry
+    if not os.path.isdir(cache_folder):
+        return
+    entries = []
+    for name in os.listdir(cache_folder):
+        st = os.stat(os.path.join(cache_folder,name))
+        entries.append((st.st_mtime, st.st_size, name))
+    entries.sort()
+    total = sum(size for mtime, size, name in entries)
+    for mtime, size, name in entries:
+        if total<=max_bytes:
+            break
+        os.remove(os.path.join(cache_folder,name))
+        total -= size
+
+class SnapshotPickler(pickle.Pickler):
+    # Groups the numpy arrays it pickles by the memory they view. Pickle
+    # copies array data, so two arrays sharing memory would come back
+    # independent, and a snapshot holding such arrays is not used.
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.views = {}
+
+    def persistent_id(self, obj):
+        if type(obj).__module__.startswith('numpy') and hasattr(obj, 'base') and hasattr(obj, 'strides'):
+            root = obj
+            while getattr(root, 'base', None) is not None and root.base is not root:
+                root = root.base
+            self.views.setdefault(id(root), set()).add(id(obj))
+        return None
+
+    def shares_memory(self):
+        return any(len(arrays)>1 for arrays in self.views.values())
+
+def snapshot(namespace):
+    # Returns None if some variable cannot be pickled, or if restoring would
+    # separate arrays that share memory. The variables are pickled together so
+    # that shared references stay shared once restored.
+    modules = {}
+    values = {}
+    for name, value in namespace.items():
+        if name=='__builtins__':
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[name] = value.__name__
+        else:
+            values[name] = value
+    buffer = io.BytesIO()
+    pickler = SnapshotPickler(buffer)
+    try:
+        pickler.dump(values)
+    except Exception:
+        return None
+    if pickler.shares_memory():
+        return None
+    return {'modules':modules, 'values':buffer.getvalue()}
+
+def restore(state):
+    namespace = pickle.loads(state['values'])
+    for name, module in state['modules'].items():
+        namespace[name] = __import__(module, fromlist=['_'])
+    return namespace
+
+# Execution ###################################################################
+
+def run_cell(source, namespace):
+    # Like a notebook: the value of a trailing expression is displayed
+    tree = ast.parse(strip_magics(source))
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, '<cell>', 'exec'), namespace)
+    if last is not None:
+        value = eval(compile(last, '<cell>', 'eval'), namespace)
+        if value is not None:
+            print(repr(value))
+
+def execute(path, use_cache=True, allow_errors=False, max_bytes=500*2**20):
+    ntbk, code_cells = read_cells(path)
+    sources = [cell_source(ntbk['cells'][i]) for i in code_cells]
+    keys = cell_keys(path, sources)
+
+    # Longest cached prefix, and the last cell in it with a usable snapshot
+    entries = []
+    if use_cache:
+        for key in keys:
+            entry = load_entry(key)
+            if entry is None:
+                break
+            entries.append(entry)
+    resume = max([i for i, entry in enumerate(entries) if entry['namespace'] is not None], default=-1)
+
+    outputs = [entry['stdout'] for entry in entries[:resume+1]]
+    for i, stdout in enumerate(outputs):
+        print('[{}] cached'.format(i))
+        sys.stdout.write(stdout)
+    errors = sum(entry['error'] for entry in entries[:resume+1])
+    namespace = restore(entries[resume]['namespace']) if resume>=0 else {'__name__':'__main__'}
+
+    # Like Jupyter, run from the notebook's folder with that folder importable
+    cwd = os.getcwd()
+    folder = os.path.dirname(os.path.abspath(path))
+    os.chdir(folder)
+    sys.path.insert(0, folder)
+    try:
+        for i in range(resume+1, len(sources)):
+            buffer = io.StringIO()
+            tic = time.perf_counter()
+            failed = False
+            with contextlib.redirect_stdout(buffer):
+                try:
+                    run_cell(sources[i], namespace)
+                except Exception:
+                    traceback.print_exc(file=buffer)
+                    failed = True
+                    errors += 1
+            print('[{}] {:.3f}s'.format(i, time.perf_counter()-tic))
+            sys.stdout.write(buffer.getvalue())
+            outputs.append(buffer.getvalue())
+            if failed and not allow_errors:
+                break
+            if use_cache:
+                save_entry(keys[i], {'stdout':buffer.getvalue(), 'error':failed, 'namespace':snapshot(namespace)})
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(folder)
+        if use_cache:
+            evict(max_bytes)
+
+    for i, stdout in zip(code_cells, outputs):
+        ntbk['cells'][i]['outputs'] = [{'name':'stdout', 'output_type':'stream', 'text':stdout}] if stdout else []
+    return ntbk, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a notebook or percent-format script cell by cell, '
+                                                 're-executing only cells whose source or upstream cells changed.')
+    parser.add_argument('path', help='.ipynb notebook or percent-format .py script')
+    parser.add_argument('-o', '--output', help='write the notebook with its outputs to this .ipynb file')
+    parser.add_argument('--no-cache', action='store_true', help='run every cell and leave the cache alone')
+    parser.add_argument('--allow-errors', action='store_true', help='keep going after a cell raises')
+    parser.add_argument('--cache-size', type=float, default=500, help='cache size limit in MB')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('MPLBACKEND','Agg')
+    ntbk, errors = execute(args.path, not args.no_cache, args.allow_errors, int(args.cache_size*2**20))
+    if args.output:
+        with open(args.output,'w',encoding='utf-8') as file:
+            file.write(json.dumps(ntbk, indent=1, sort_keys=True, ensure_ascii=False)+'\n')
+    if errors:
+        sys.exit(1)
+
+if __name__=='__main__':
+    main(sys.argv[1:])